@@ -3,10 +3,17 @@ from flask_cors import CORS
 from .extensions import db, jwt
 from .config import Config
 from .routes import bp as routes_bp
+from .cli import register_commands
+from .progress_queue import progress_writer
+from .sharding import init_sharding
+from .diagnostics import slow_query_log
+from .events import progress_events
 
-def create_app():
+def create_app(config_overrides=None):
     app = Flask(__name__)
     app.config.from_object(Config)
+    if config_overrides:
+        app.config.update(config_overrides)
 
     db.init_app(app)
     jwt.init_app(app)
@@ -16,6 +23,15 @@ def create_app():
     with app.app_context():
         db.create_all()
 
+    sharding = init_sharding(app, db)
+
+    with app.app_context():
+        engines = list(db.engines.values()) + (list(sharding.engines.values()) if sharding else [])
+    slow_query_log.init_app(app, engines)
+    progress_writer.init_app(app)
+    progress_events.init_app(app)
+
     app.register_blueprint(routes_bp)
+    register_commands(app)
 
     return app
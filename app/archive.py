@@ -0,0 +1,219 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+import zlib
+from datetime import date as date_type, datetime, timedelta
+from flask import current_app
+from app.models import MealPlan, WorkoutPlan, Recipe, Exercise, db
+
+# архивируемые планы: вид -> (модель, упакованные колонки)
+ARCHIVED_PLANS = {
+    "meal": (MealPlan, ("id", "date", "meal_type", "recipe_id", "calories", "protein", "carbs", "fats", "eaten")),
+    "workout": (WorkoutPlan, ("id", "date", "exercise_id", "duration", "intensity", "completed"))
+}
+
+ARCHIVE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS plan_archive (
+    kind TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    month TEXT NOT NULL,
+    row_count INTEGER NOT NULL,
+    payload BLOB NOT NULL,
+    PRIMARY KEY (kind, user_id, month)
+)
+'''
+
+# количество строк в таблице (при шардировании запрос возвращает по строке на шард)
+def count_rows(model):
+    return sum(count for (count,) in db.session.query(db.func.count(model.id)).all())
+
+# путь к файлу архива
+def get_archive_path():
+    path = current_app.config.get('ARCHIVE_DATABASE_PATH')
+    if not path:
+        os.makedirs(current_app.instance_path, exist_ok=True)
+        path = os.path.join(current_app.instance_path, 'healthManager_archive.db')
+    return path
+
+def connect_archive():
+    connection = sqlite3.connect(get_archive_path(), timeout=30)
+    connection.execute(ARCHIVE_SCHEMA)
+    return connection
+
+# упаковка строк плана за месяц: json + zlib
+def pack_rows(rows):
+    return zlib.compress(json.dumps(rows, separators=(',', ':')).encode('utf-8'))
+
+def unpack_rows(payload):
+    return json.loads(zlib.decompress(payload).decode('utf-8'))
+
+# запись строк в архив с объединением по (вид, пользователь, месяц)
+# строки с уже заархивированным id заменяются, поэтому повторный запуск после сбоя безопасен
+def _store_archived_rows(connection, kind, grouped):
+    for (user_id, month), rows in grouped.items():
+        existing = connection.execute(
+            "SELECT payload FROM plan_archive WHERE kind = ? AND user_id = ? AND month = ?",
+            (kind, user_id, month)
+        ).fetchone()
+
+        merged = {row[0]: row for row in unpack_rows(existing[0])} if existing else {}
+        for row in rows:
+            merged[row[0]] = row
+        packed = sorted(merged.values(), key=lambda row: (row[1], row[0]))
+
+        connection.execute(
+            "INSERT OR REPLACE INTO plan_archive (kind, user_id, month, row_count, payload) VALUES (?, ?, ?, ?, ?)",
+            (kind, user_id, month, len(packed), pack_rows(packed))
+        )
+
+# индексы по дате в таблицах планов: create_all не добавляет их в уже существующие таблицы
+def ensure_archive_indexes():
+    sharding = current_app.extensions.get('sharding')
+    engines = sharding.engines.values() if sharding else [db.engine]
+    for engine in engines:
+        for model, _ in ARCHIVED_PLANS.values():
+            for index in model.__table__.indexes:
+                index.create(engine, checkfirst=True)
+
+# перенос планов старше горизонта в архив небольшими пакетами
+def archive_plans(horizon_days=None, batch_size=None, pause=0.0):
+    horizon_days = horizon_days if horizon_days is not None else current_app.config['ARCHIVE_HORIZON_DAYS']
+    batch_size = batch_size or current_app.config['ARCHIVE_BATCH_SIZE']
+    cutoff = datetime.utcnow().date() - timedelta(days=horizon_days)
+
+    ensure_archive_indexes()
+
+    report = {"cutoff": cutoff.isoformat()}
+    connection = connect_archive()
+    try:
+        for kind, (model, columns) in ARCHIVED_PLANS.items():
+            rows_before = count_rows(model)
+            archived = 0
+
+            # пакет читается по индексу (date, id) с начала: обработанные строки уже удалены
+            while True:
+                batch = db.session.query(model.user_id, *[getattr(model, column) for column in columns]) \
+                    .filter(model.date < cutoff) \
+                    .order_by(model.date, model.id) \
+                    .limit(batch_size) \
+                    .all()
+                if not batch:
+                    break
+
+                grouped = {}
+                for user_id, *values in batch:
+                    row = [value.isoformat() if isinstance(value, date_type) else value for value in values]
+                    grouped.setdefault((user_id, row[1][:7]), []).append(row)
+
+                # сначала фиксируем архив, затем удаляем строки из основной базы
+                with connection:
+                    _store_archived_rows(connection, kind, grouped)
+
+                ids = [values[1] for values in batch]
+                model.query.filter(model.id.in_(ids)).delete(synchronize_session=False)
+                db.session.commit()
+
+                archived += len(batch)
+                logging.debug(f"Архивировано {archived} строк {model.__tablename__}.")
+                if pause:
+                    time.sleep(pause)
+
+            report[model.__tablename__] = {
+                "rows_before": rows_before,
+                "rows_archived": archived,
+                "rows_after": count_rows(model)
+            }
+    finally:
+        connection.close()
+
+    report["archive_bytes"] = os.path.getsize(get_archive_path())
+    return report
+
+# чтение заархивированных планов пользователя за период одним запросом: вид -> строки
+def load_archived_plans_by_kind(user_id, start, end, kinds=tuple(ARCHIVED_PLANS)):
+    archived = {kind: [] for kind in kinds}
+    path = get_archive_path()
+    if not os.path.exists(path):
+        return archived
+
+    connection = connect_archive()
+    try:
+        payloads = connection.execute(
+            f"SELECT kind, payload FROM plan_archive WHERE kind IN ({', '.join('?' * len(kinds))}) "
+            "AND user_id = ? AND month BETWEEN ? AND ?",
+            (*kinds, user_id, start.isoformat()[:7], end.isoformat()[:7])
+        ).fetchall()
+    finally:
+        connection.close()
+
+    start_iso, end_iso = start.isoformat(), end.isoformat()
+    for kind, payload in payloads:
+        columns = ARCHIVED_PLANS[kind][1]
+        archived[kind].extend(
+            dict(zip(columns, row))
+            for row in unpack_rows(payload)
+            if start_iso <= row[1] <= end_iso
+        )
+    return archived
+
+def load_archived_plans(kind, user_id, start, end):
+    return load_archived_plans_by_kind(user_id, start, end, (kind,))[kind]
+
+# заархивированные приемы пищи в формате MealPlan.to_dict() (названия рецептов — одним запросом)
+def archived_meal_dicts(rows):
+    recipe_ids = {row["recipe_id"] for row in rows}
+    recipe_names = dict(db.session.query(Recipe.id, Recipe.name).filter(Recipe.id.in_(recipe_ids)).all()) if recipe_ids else {}
+
+    return [
+        (row["date"], {
+            'id': row["id"],
+            'meal_type': row["meal_type"],
+            'recipe': recipe_names.get(row["recipe_id"]),
+            'calories': row["calories"],
+            'protein': row["protein"],
+            'carbs': row["carbs"],
+            'fats': row["fats"],
+            'eaten': row["eaten"]
+        })
+        for row in rows
+    ]
+
+# заархивированные тренировки в формате WorkoutPlan.to_dict() (названия упражнений — одним запросом)
+def archived_workout_dicts(rows):
+    exercise_ids = {row["exercise_id"] for row in rows}
+    exercise_names = dict(db.session.query(Exercise.id, Exercise.name).filter(Exercise.id.in_(exercise_ids)).all()) if exercise_ids else {}
+
+    return [
+        (row["date"], {
+            'id': row["id"],
+            'workout_type': exercise_names.get(row["exercise_id"]),
+            'duration': row["duration"],
+            'intensity': row["intensity"],
+            'completed': row["completed"]
+        })
+        for row in rows
+    ]
+
+# история планов питания: основная база + архив, сгруппировано по датам
+def get_meal_plan_history(user_id, start, end):
+    history = {}
+    for meal in MealPlan.query.filter(MealPlan.user_id == user_id, MealPlan.date.between(start, end)).all():
+        history.setdefault(meal.date.isoformat(), []).append(meal.to_dict())
+
+    for day, meal in archived_meal_dicts(load_archived_plans("meal", user_id, start, end)):
+        history.setdefault(day, []).append(meal)
+
+    return dict(sorted(history.items()))
+
+# история планов тренировок: основная база + архив, сгруппировано по датам
+def get_workout_plan_history(user_id, start, end):
+    history = {}
+    for workout in WorkoutPlan.query.filter(WorkoutPlan.user_id == user_id, WorkoutPlan.date.between(start, end)).all():
+        history.setdefault(workout.date.isoformat(), []).append(workout.to_dict())
+
+    for day, workout in archived_workout_dicts(load_archived_plans("workout", user_id, start, end)):
+        history.setdefault(day, []).append(workout)
+
+    return dict(sorted(history.items()))
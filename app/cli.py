@@ -0,0 +1,100 @@
+import click
+from flask import current_app
+from datetime import datetime
+from flask.cli import with_appcontext
+from app.models import User, MealPlan, db
+from app.cohort import calculate_cohort_targets
+from app.utils import generate_meal_plan, store_user_targets
+from app.archive import archive_plans
+from app.sharding import rebalance_shards
+from app.diagnostics import get_slow_query_log_path, read_slow_query_log, summarize_slow_queries
+import logging
+
+# ночная предварительная генерация планов питания на текущий день
+@click.command('pregenerate-meal-plans')
+@with_appcontext
+def pregenerate_meal_plans_command():
+    today = datetime.utcnow().date()
+
+    planned_user_ids = {
+        user_id for (user_id,) in db.session.query(MealPlan.user_id).filter(MealPlan.date == today).distinct()
+    }
+    users = [user for user in User.query.order_by(User.id).all() if user.id not in planned_user_ids]
+
+    targets = calculate_cohort_targets([user.id for user in users])
+
+    generated = 0
+    for user in users:
+        store_user_targets(user, targets[user.id])
+        result = generate_meal_plan(user, targets[user.id])
+        if "meal_plan" in result:
+            generated += 1
+        else:
+            logging.warning(f"План питания для пользователя {user.username} не сгенерирован: {result['msg']}")
+
+    db.session.commit()
+
+    click.echo(f"Сгенерировано планов питания: {generated} из {len(users)}")
+
+# перенос старых планов питания и тренировок в архив
+@click.command('archive-plans')
+@click.option('--horizon-days', type=int, default=None, help='Архивировать планы старше указанного числа дней.')
+@click.option('--batch-size', type=int, default=None, help='Количество строк в одной транзакции.')
+@click.option('--pause', type=float, default=0.0, help='Пауза между пакетами в секундах.')
+@with_appcontext
+def archive_plans_command(horizon_days, batch_size, pause):
+    report = archive_plans(horizon_days, batch_size, pause)
+
+    click.echo(f"Архивированы планы до {report['cutoff']}:")
+    for table in ('meal_plan', 'workout_plan'):
+        stats = report[table]
+        shrink = stats['rows_archived'] / stats['rows_before'] * 100 if stats['rows_before'] else 0
+        click.echo(f"  {table}: {stats['rows_before']} -> {stats['rows_after']} строк (-{shrink:.1f}%)")
+    click.echo(f"  размер архива: {report['archive_bytes']} байт")
+
+# перераспределение пользователей по шардам после изменения SHARD_COUNT
+@click.command('rebalance-shards')
+@click.option('--previous-count', type=int, required=True, help='Количество шардов до изменения SHARD_COUNT.')
+@with_appcontext
+def rebalance_shards_command(previous_count):
+    sharding = current_app.extensions.get('sharding')
+    if sharding is None:
+        raise click.ClickException("Шардирование выключено: задайте SHARD_COUNT больше 1.")
+
+    report = rebalance_shards(sharding, previous_count)
+
+    for name, stats in report.items():
+        status = " (можно удалить)" if stats['retired'] else ""
+        click.echo(f"{name}: пользователей {stats['users_before']}, перенесено {stats['users_moved']}{status}")
+
+# сводка по самым медленным запросам из журнала
+@click.command('slow-queries')
+@click.option('--top', type=int, default=10, help='Количество запросов в сводке.')
+@click.option('--path', default=None, help='Путь к журналу медленных запросов.')
+@with_appcontext
+def slow_queries_command(top, path):
+    path = path or get_slow_query_log_path(current_app)
+    worst = summarize_slow_queries(read_slow_query_log(path), top)
+
+    if not worst:
+        click.echo(f"Медленных запросов не найдено ({path}).")
+        return
+
+    for index, stats in enumerate(worst, 1):
+        click.echo(
+            f"{index}. всего {stats['total_ms']:.1f} мс, вызовов {stats['count']}, "
+            f"среднее {stats['avg_ms']:.1f} мс, максимум {stats['max_ms']:.1f} мс"
+        )
+        click.echo(f"   {stats['statement'][:200]}")
+        if stats['routes']:
+            click.echo(f"   маршруты: {', '.join(stats['routes'])}")
+        if stats['full_scans']:
+            click.echo(f"   ПОЛНЫЙ ПРОСМОТР ТАБЛИЦ: {', '.join(stats['full_scans'])}")
+        for detail in stats['plan']:
+            click.echo(f"   план: {detail}")
+
+def register_commands(app):
+    app.cli.add_command(pregenerate_meal_plans_command)
+    app.cli.add_command(archive_plans_command)
+    app.cli.add_command(rebalance_shards_command)
+    app.cli.add_command(slow_queries_command)
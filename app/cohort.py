@@ -0,0 +1,107 @@
+import numpy as np
+from app.models import User, db
+from app.utils import ACTIVITY_MULTIPLIER, GOAL_CALORIE_OFFSET
+
+# показатели, которые рассчитываются для каждого пользователя когорты
+TARGET_FIELDS = ("bmr", "tdee", "daily_calories", "protein", "fats", "carbs")
+
+# векторизованный расчет показателей для массивов параметров пользователей
+# результаты совпадают с calculate_bmr, calculate_tdee, calculate_calories и calculate_bju
+def calculate_targets_batch(weight, height, age, gender, activity_level, goal):
+    weight = np.asarray(weight, dtype=np.float64)
+    height = np.asarray(height, dtype=np.float64)
+    age = np.asarray(age, dtype=np.float64)
+    gender = np.asarray(gender, dtype=object)
+    activity_level = np.asarray(activity_level, dtype=object)
+    goal = np.asarray(goal, dtype=object)
+
+    gender_offset = np.where(gender == 'male', 5.0, -161.0)
+    bmr = 10 * weight + 6.25 * height - 5 * age + gender_offset
+
+    multiplier = np.full(bmr.shape, 1.2)
+    for level, value in ACTIVITY_MULTIPLIER.items():
+        multiplier[activity_level == level] = value
+    tdee = bmr * multiplier
+
+    calorie_offset = np.zeros(bmr.shape)
+    for goal_name, value in GOAL_CALORIE_OFFSET.items():
+        calorie_offset[goal == goal_name] = value
+    daily_calories = tdee + calorie_offset
+
+    return {
+        "bmr": bmr,
+        "tdee": tdee,
+        "daily_calories": daily_calories,
+        "protein": np.round((tdee * 0.30) / 4, 0),
+        "fats": np.round((tdee * 0.25) / 9, 0),
+        "carbs": np.round((tdee * 0.45) / 4, 0)
+    }
+
+# выгрузка параметров пользователей в виде колонок
+def load_user_columns(user_ids=None):
+    query = db.session.query(
+        User.id, User.weight, User.height, User.age,
+        User.gender, User.activity_level, User.goal
+    )
+    if user_ids is not None:
+        query = query.filter(User.id.in_(user_ids))
+    rows = query.order_by(User.id).all()
+
+    columns = list(zip(*rows)) if rows else [()] * 7
+    return {
+        "id": np.asarray(columns[0], dtype=np.int64),
+        "weight": columns[1],
+        "height": columns[2],
+        "age": columns[3],
+        "gender": columns[4],
+        "activity_level": columns[5],
+        "goal": columns[6]
+    }
+
+# расчет показателей для всех (или выбранных) пользователей
+# возвращает словарь user_id -> показатели в том же формате, что и calculate_targets
+def calculate_cohort_targets(user_ids=None):
+    columns = load_user_columns(user_ids)
+    targets = calculate_targets_batch(
+        columns["weight"], columns["height"], columns["age"],
+        columns["gender"], columns["activity_level"], columns["goal"]
+    )
+
+    return {
+        int(user_id): {field: float(targets[field][i]) for field in TARGET_FIELDS}
+        for i, user_id in enumerate(columns["id"])
+    }
+
+# сводная статистика по массиву значений
+def _describe(values):
+    if values.size == 0:
+        return {"mean": None, "median": None, "min": None, "max": None}
+    return {
+        "mean": round(float(values.mean()), 1),
+        "median": round(float(np.median(values)), 1),
+        "min": round(float(values.min()), 1),
+        "max": round(float(values.max()), 1)
+    }
+
+# статистика по когорте пользователей: общая и в разрезе целей
+def calculate_cohort_statistics():
+    columns = load_user_columns()
+    targets = calculate_targets_batch(
+        columns["weight"], columns["height"], columns["age"],
+        columns["gender"], columns["activity_level"], columns["goal"]
+    )
+    goals = np.asarray(columns["goal"], dtype=object)
+
+    by_goal = {}
+    for goal_name in sorted(set(columns["goal"])):
+        mask = goals == goal_name
+        by_goal[goal_name] = {
+            "users": int(mask.sum()),
+            **{field: _describe(targets[field][mask]) for field in TARGET_FIELDS}
+        }
+
+    return {
+        "users": int(columns["id"].size),
+        **{field: _describe(targets[field]) for field in TARGET_FIELDS},
+        "by_goal": by_goal
+    }
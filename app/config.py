@@ -4,4 +4,47 @@ class Config:
     SQLALCHEMY_DATABASE_URI = 'sqlite:///healthManager.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SECRET_KEY = os.urandom(24)
-    JWT_SECRET_KEY = os.urandom(24)
\ No newline at end of file
+    JWT_SECRET_KEY = os.urandom(24)
+    ADMIN_USERNAMES = [name.strip() for name in os.environ.get('ADMIN_USERNAMES', '').split(',') if name.strip()]
+
+    # отложенная запись прогресса (write-behind)
+    PROGRESS_WRITE_BEHIND = os.environ.get('PROGRESS_WRITE_BEHIND', '0') == '1'
+    PROGRESS_FLUSH_INTERVAL = 0.5
+    PROGRESS_FLUSH_MAX_PENDING = 200
+    PROGRESS_JOURNAL_FSYNC = True
+    PROGRESS_JOURNAL_DIR = None
+
+    # архивирование старых планов
+    ARCHIVE_DATABASE_PATH = None
+    ARCHIVE_HORIZON_DAYS = 90
+    ARCHIVE_BATCH_SIZE = 500
+
+    # количество шардов для пользовательских таблиц (1 — без шардирования)
+    SHARD_COUNT = int(os.environ.get('SHARD_COUNT', '1'))
+    # через сколько секунд резерв логина без пользователя в шарде считается брошенным
+    SHARD_USERNAME_RESERVATION_GRACE = 300
+
+    # шаблоны планов питания и тренировок
+    PLAN_TEMPLATES_ENABLED = True
+    PLAN_TEMPLATE_VARIANTS = 7
+    PLAN_TEMPLATE_CALORIE_BUCKET = 200
+    PLAN_TEMPLATE_CANDIDATES = 5
+    PLAN_TEMPLATE_TTL = 3600
+
+    # журнал медленных запросов с планами выполнения
+    SLOW_QUERY_LOG_ENABLED = os.environ.get('SLOW_QUERY_LOG', '0') == '1'
+    SLOW_QUERY_THRESHOLD_MS = 50
+    SLOW_QUERY_LOG_PATH = None
+    SLOW_QUERY_LOG_MAX_BYTES = 5 * 1024 * 1024
+    SLOW_QUERY_LOG_BACKUPS = 5
+    SLOW_QUERY_WATCHED_TABLES = ('meal_plan', 'workout_plan', 'user_progress')
+    # колонки, значения которых не записываются в журнал
+    SLOW_QUERY_REDACTED_COLUMNS = ('password_hash',)
+
+    # поток изменений прогресса (Server-Sent Events)
+    PROGRESS_EVENTS_BACKEND = os.environ.get('PROGRESS_EVENTS_BACKEND', 'memory')
+    PROGRESS_EVENTS_DB_PATH = None
+    PROGRESS_EVENTS_POLL_INTERVAL = 0.5
+    PROGRESS_EVENTS_RETENTION = 3600
+    PROGRESS_STREAM_HEARTBEAT = 15
+    PROGRESS_STREAM_QUEUE_SIZE = 100
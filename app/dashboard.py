@@ -0,0 +1,77 @@
+from datetime import date as date_type, timedelta
+from sqlalchemy.orm import contains_eager
+from app.models import MealPlan, WorkoutPlan, UserProgress
+from app.utils import lookup_user_targets
+from app.archive import load_archived_plans_by_kind, archived_meal_dicts, archived_workout_dicts
+
+# сводка за период: показатели профиля, планы питания и тренировок, прогресс по дням.
+# данные собираются фиксированным числом запросов независимо от длины периода:
+# пять к основной базе, один к файлу архива и, если в архиве нашлись планы за период,
+# по одному на названия их рецептов и упражнений.
+def build_dashboard(user, start, end):
+    targets = lookup_user_targets(user)
+
+    meal_plans = MealPlan.query \
+        .join(MealPlan.recipe) \
+        .options(contains_eager(MealPlan.recipe)) \
+        .filter(MealPlan.user_id == user.id, MealPlan.date.between(start, end)) \
+        .order_by(MealPlan.date, MealPlan.id) \
+        .all()
+
+    workout_plans = WorkoutPlan.query \
+        .join(WorkoutPlan.exercise) \
+        .options(contains_eager(WorkoutPlan.exercise)) \
+        .filter(WorkoutPlan.user_id == user.id, WorkoutPlan.date.between(start, end)) \
+        .order_by(WorkoutPlan.date, WorkoutPlan.id) \
+        .all()
+
+    progress_rows = UserProgress.query \
+        .filter(UserProgress.user_id == user.id, UserProgress.date.between(start, end)) \
+        .all()
+
+    days = {}
+    day = start
+    while day <= end:
+        days[day] = {"date": day.isoformat(), "meal_plan": [], "workout_plan": [], "progress": None}
+        day += timedelta(days=1)
+
+    for meal in meal_plans:
+        days[meal.date]["meal_plan"].append(meal.to_dict())
+    for workout in workout_plans:
+        days[workout.date]["workout_plan"].append(workout.to_dict())
+
+    # планы старше горизонта хранения могли быть перенесены в архив
+    archived = load_archived_plans_by_kind(user.id, start, end)
+    for day, meal in archived_meal_dicts(archived["meal"]):
+        days[date_type.fromisoformat(day)]["meal_plan"].append(meal)
+    for day, workout in archived_workout_dicts(archived["workout"]):
+        days[date_type.fromisoformat(day)]["workout_plan"].append(workout)
+
+    progress_by_date = {}
+    for progress in progress_rows:
+        progress_by_date.setdefault(progress.date, progress)
+
+    # потребление считается по съеденным приемам пищи, как в /user-progress
+    for day, entry in days.items():
+        eaten = [meal for meal in entry["meal_plan"] if meal["eaten"]]
+        progress = progress_by_date.get(day)
+        entry["progress"] = {
+            "total_calories_consumed": sum(meal["calories"] for meal in eaten),
+            "total_calories_burned": progress.total_calories_burned if progress else 0,
+            "workouts_completed": progress.workouts_completed if progress else 0,
+            "total_protein_consumed": sum(meal["protein"] for meal in eaten),
+            "total_carbs_consumed": sum(meal["carbs"] for meal in eaten),
+            "total_fats_consumed": sum(meal["fats"] for meal in eaten),
+        }
+
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "profile": {
+            "username": user.username,
+            "goal": user.goal,
+            "training_days": user.training_days.split(', ') if user.training_days else [],
+            **targets
+        },
+        "days": list(days.values())
+    }
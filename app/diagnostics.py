@@ -0,0 +1,177 @@
+import json
+import logging
+import os
+import re
+import time
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from flask import has_request_context, request
+from sqlalchemy import event
+
+# полный просмотр таблицы в выводе EXPLAIN QUERY PLAN (без использования индекса)
+FULL_SCAN_PATTERN = re.compile(r'^SCAN (?:TABLE )?(\w+)\b(?! USING)')
+EXPLAINABLE_STATEMENTS = ('SELECT', 'UPDATE', 'DELETE', 'INSERT', 'WITH')
+# значение скрытого параметра в журнале
+REDACTED = '[скрыто]'
+# номер, который SQLAlchemy добавляет к имени параметра (password_hash_1)
+BIND_SUFFIX_PATTERN = re.compile(r'_\d+$')
+
+slow_query_logger = logging.getLogger('healthmanager.slow_queries')
+
+# путь к журналу медленных запросов
+def get_slow_query_log_path(app):
+    path = app.config.get('SLOW_QUERY_LOG_PATH')
+    if not path:
+        os.makedirs(app.instance_path, exist_ok=True)
+        path = os.path.join(app.instance_path, 'slow_queries.log')
+    return path
+
+# план выполнения запроса через отдельный курсор того же соединения
+def explain_query_plan(conn, statement, parameters):
+    if not statement.lstrip().upper().startswith(EXPLAINABLE_STATEMENTS):
+        return []
+    if isinstance(parameters, list):
+        parameters = parameters[0] if parameters else ()
+
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ())
+        return [row[3] for row in cursor.fetchall()]
+    except Exception as e:
+        return [f"EXPLAIN недоступен: {e}"]
+    finally:
+        cursor.close()
+
+# скрытие значений чувствительных колонок в параметрах запроса.
+# позиционные параметры сопоставляются с колонками по именам из скомпилированного запроса;
+# если сопоставить не удается, скрываются все параметры запроса с такой колонкой
+def redact_parameters(statement, parameters, context, redacted_columns):
+    if not parameters or not any(column in statement for column in redacted_columns):
+        return parameters
+
+    compiled = getattr(context, 'compiled', None)
+    names = getattr(compiled, 'positiontup', None)
+
+    def is_redacted(name):
+        return BIND_SUFFIX_PATTERN.sub('', name) in redacted_columns
+
+    def redact_row(row):
+        if isinstance(row, dict):
+            return {name: REDACTED if is_redacted(name) else value for name, value in row.items()}
+        if names and len(names) == len(row):
+            return [REDACTED if is_redacted(name) else value for name, value in zip(names, row)]
+        return [REDACTED] * len(row)
+
+    if isinstance(parameters, list) and parameters and isinstance(parameters[0], (tuple, list, dict)):
+        return [redact_row(row) for row in parameters]
+    return redact_row(parameters)
+
+# полные просмотры отслеживаемых таблиц
+def find_full_scans(plan, watched_tables):
+    scans = []
+    for detail in plan:
+        match = FULL_SCAN_PATTERN.match(detail)
+        if match and match.group(1) in watched_tables:
+            scans.append(match.group(1))
+    return scans
+
+# журнал медленных запросов: перехват событий движков SQLAlchemy
+class SlowQueryLog:
+    def __init__(self):
+        self.threshold = 0.05
+        self.watched_tables = ()
+        self.redacted_columns = ()
+
+    def init_app(self, app, engines):
+        if not app.config.get('SLOW_QUERY_LOG_ENABLED', False):
+            return
+
+        self.threshold = app.config.get('SLOW_QUERY_THRESHOLD_MS', 50) / 1000
+        self.watched_tables = tuple(app.config.get('SLOW_QUERY_WATCHED_TABLES', ()))
+        self.redacted_columns = tuple(app.config.get('SLOW_QUERY_REDACTED_COLUMNS', ()))
+
+        path = get_slow_query_log_path(app)
+        if not any(getattr(handler, 'baseFilename', None) == os.path.abspath(path) for handler in slow_query_logger.handlers):
+            handler = RotatingFileHandler(
+                path,
+                maxBytes=app.config.get('SLOW_QUERY_LOG_MAX_BYTES', 5 * 1024 * 1024),
+                backupCount=app.config.get('SLOW_QUERY_LOG_BACKUPS', 5),
+                encoding='utf-8'
+            )
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            slow_query_logger.addHandler(handler)
+        slow_query_logger.setLevel(logging.INFO)
+        slow_query_logger.propagate = False
+
+        for engine in engines:
+            if not event.contains(engine, 'before_cursor_execute', self.before_cursor_execute):
+                event.listen(engine, 'before_cursor_execute', self.before_cursor_execute)
+                event.listen(engine, 'after_cursor_execute', self.after_cursor_execute)
+
+        logging.info(f"Журнал медленных запросов включен: {path}")
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        if elapsed < self.threshold:
+            return
+
+        plan = explain_query_plan(conn, statement, parameters)
+        entry = {
+            "time": datetime.utcnow().isoformat(timespec='milliseconds'),
+            "duration_ms": round(elapsed * 1000, 2),
+            "statement": statement,
+            "parameters": redact_parameters(statement, parameters, context, self.redacted_columns),
+            "route": f"{request.method} {request.path}" if has_request_context() else None,
+            "endpoint": request.endpoint if has_request_context() else None,
+            "database": conn.engine.url.database,
+            "plan": plan,
+            "full_scans": find_full_scans(plan, self.watched_tables)
+        }
+        slow_query_logger.info(json.dumps(entry, ensure_ascii=False, default=str))
+
+# чтение журнала медленных запросов вместе с архивными файлами ротации
+def read_slow_query_log(path):
+    paths = [path] + [f"{path}.{index}" for index in range(1, 100) if os.path.exists(f"{path}.{index}")]
+    for log_path in paths:
+        if not os.path.exists(log_path):
+            continue
+        with open(log_path, encoding='utf-8') as log_file:
+            for line in log_file:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+# сводка по самым затратным запросам
+def summarize_slow_queries(entries, top=10):
+    summary = {}
+    for entry in entries:
+        statement = ' '.join(entry['statement'].split())
+        stats = summary.setdefault(statement, {
+            "statement": statement,
+            "count": 0,
+            "total_ms": 0.0,
+            "max_ms": 0.0,
+            "routes": set(),
+            "full_scans": set(),
+            "plan": entry['plan']
+        })
+        stats["count"] += 1
+        stats["total_ms"] += entry['duration_ms']
+        stats["max_ms"] = max(stats["max_ms"], entry['duration_ms'])
+        if entry.get('route'):
+            stats["routes"].add(entry['route'])
+        stats["full_scans"].update(entry.get('full_scans', []))
+
+    worst = sorted(summary.values(), key=lambda stats: stats["total_ms"], reverse=True)[:top]
+    for stats in worst:
+        stats["avg_ms"] = stats["total_ms"] / stats["count"]
+        stats["routes"] = sorted(stats["routes"])
+        stats["full_scans"] = sorted(stats["full_scans"])
+    return worst
+
+
+slow_query_log = SlowQueryLog()
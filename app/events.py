@@ -0,0 +1,204 @@
+import itertools
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+# подписка одного соединения на события пользователя.
+# last_event_id — последнее событие на момент подписки: оно и более ранние уже учтены
+# в снимке прогресса, который клиент получает первым, поэтому не передаются повторно.
+# события, опубликованные между подпиской и чтением снимка, отсеиваются по id планов,
+# отметки которых учтены в снимке (mark_counted)
+class Subscription:
+    def __init__(self, user_id, maxsize, last_event_id=0):
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.overflowed = False
+        self.last_event_id = last_event_id
+        self.counted = {}
+
+    def mark_counted(self, field, ids):
+        self.counted.setdefault(field, set()).update(ids)
+
+    # событие об отметке, которая уже учтена в снимке или передана клиенту
+    def already_counted(self, event):
+        for field, ids in self.counted.items():
+            plan_id = event.get(field)
+            if plan_id is None:
+                continue
+            if plan_id in ids:
+                return True
+            ids.add(plan_id)
+        return False
+
+    def put(self, event):
+        if event[0] <= self.last_event_id:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # клиент не успевает читать: он получит событие resync и перечитает прогресс
+            self.overflowed = True
+
+# публикация изменений прогресса и подписка на них.
+# по умолчанию события передаются в памяти процесса; при нескольких рабочих процессах
+# (PROGRESS_EVENTS_BACKEND = 'sqlite') события пишутся в локальный файл SQLite,
+# который каждый процесс опрашивает только пока у него есть подписчики.
+class ProgressEventBroker:
+    def __init__(self):
+        self.backend = 'memory'
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._counter = itertools.count(1)
+        self._last_event_id = 0
+        self._poller = None
+        self._has_subscribers = threading.Event()
+
+    def init_app(self, app):
+        self.backend = app.config.get('PROGRESS_EVENTS_BACKEND', 'memory')
+        self.heartbeat = app.config.get('PROGRESS_STREAM_HEARTBEAT', 15)
+        self.queue_size = app.config.get('PROGRESS_STREAM_QUEUE_SIZE', 100)
+        self.poll_interval = app.config.get('PROGRESS_EVENTS_POLL_INTERVAL', 0.5)
+        self.retention = app.config.get('PROGRESS_EVENTS_RETENTION', 3600)
+
+        if self.backend != 'sqlite':
+            return
+
+        self.db_path = app.config.get('PROGRESS_EVENTS_DB_PATH')
+        if not self.db_path:
+            os.makedirs(app.instance_path, exist_ok=True)
+            self.db_path = os.path.join(app.instance_path, 'progress_events.db')
+
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS progress_event ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, payload TEXT NOT NULL)"
+            )
+            self._last_id = connection.execute("SELECT COALESCE(MAX(id), 0) FROM progress_event").fetchone()[0]
+
+        if self._poller is None:
+            self._poller = threading.Thread(target=self._poll, name='progress-events-poller', daemon=True)
+            self._poller.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.db_path, timeout=10)
+        connection.execute("PRAGMA journal_mode=WAL")
+        return connection
+
+    # публикация события пользователя
+    def publish(self, user_id, event):
+        if self.backend == 'sqlite':
+            now = time.time()
+            with closing(self._connect()) as connection, connection:
+                connection.execute(
+                    "INSERT INTO progress_event (user_id, created_at, payload) VALUES (?, ?, ?)",
+                    (user_id, now, json.dumps(event, ensure_ascii=False, default=str))
+                )
+                connection.execute("DELETE FROM progress_event WHERE created_at < ?", (now - self.retention,))
+            return
+
+        with self._lock:
+            event_id = next(self._counter)
+            self._last_event_id = event_id
+        self._dispatch(user_id, event_id, event)
+
+    # id последнего опубликованного события
+    def last_event_id(self):
+        if self.backend != 'sqlite':
+            return self._last_event_id
+
+        with closing(self._connect()) as connection:
+            return connection.execute(
+                "SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'progress_event'), 0)"
+            ).fetchone()[0]
+
+    def _dispatch(self, user_id, event_id, event):
+        with self._lock:
+            subscriptions = list(self._subscribers.get(user_id, ()))
+        for subscription in subscriptions:
+            subscription.put((event_id, event))
+
+    def subscribe(self, user_id):
+        last_event_id = self.last_event_id()
+        subscription = Subscription(user_id, self.queue_size, last_event_id)
+        with self._lock:
+            if self.backend == 'sqlite' and not self._subscribers:
+                # события, опубликованные пока подписчиков не было, не опрашиваются
+                self._last_id = max(self._last_id, last_event_id)
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+            self._has_subscribers.set()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscribers.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscribers[subscription.user_id]
+            if not self._subscribers:
+                self._has_subscribers.clear()
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscribers.values())
+
+    # опрос общего файла событий (только для backend = 'sqlite')
+    def _poll(self):
+        while True:
+            self._has_subscribers.wait()
+            try:
+                with closing(self._connect()) as connection, connection:
+                    rows = connection.execute(
+                        "SELECT id, user_id, payload FROM progress_event WHERE id > ? ORDER BY id",
+                        (self._last_id,)
+                    ).fetchall()
+                for event_id, user_id, payload in rows:
+                    self._last_id = event_id
+                    self._dispatch(user_id, event_id, json.loads(payload))
+            except sqlite3.Error as e:
+                logging.error(f"Ошибка чтения событий прогресса: {e}")
+            time.sleep(self.poll_interval)
+
+    # поток событий в формате Server-Sent Events
+    def stream(self, subscription, initial_event=None):
+        try:
+            if initial_event is not None:
+                yield format_sse(initial_event, event_type='snapshot', event_id=subscription.last_event_id)
+
+            while True:
+                try:
+                    event_id, event = subscription.queue.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+
+                if subscription.overflowed:
+                    subscription.overflowed = False
+                    while not subscription.queue.empty():
+                        subscription.queue.get_nowait()
+                    yield format_sse({"type": "resync"}, event_type='resync')
+                    continue
+
+                if subscription.already_counted(event):
+                    continue
+
+                yield format_sse(event, event_id=event_id)
+        finally:
+            self.unsubscribe(subscription)
+
+def format_sse(data, event_type='progress', event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+
+progress_events = ProgressEventBroker()
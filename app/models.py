@@ -49,6 +49,9 @@ class Exercise(db.Model):
 
 # модель для плана питания
 class MealPlan(db.Model):
+    # выборка старых строк при архивации
+    __table_args__ = (db.Index('ix_meal_plan_date_id', 'date', 'id'),)
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     date = db.Column(db.Date, nullable=False)
@@ -80,6 +83,9 @@ class MealPlan(db.Model):
 
 # модель для плана тренировок
 class WorkoutPlan(db.Model):
+    # выборка старых строк при архивации
+    __table_args__ = (db.Index('ix_workout_plan_date_id', 'date', 'id'),)
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     date = db.Column(db.Date, nullable=False)
@@ -118,4 +124,39 @@ class UserProgress(db.Model):
     user = db.relationship('User', backref='progress')
 
     def __repr__(self):
-        return f'<Прогресс пользователя {self.user_id} за {self.date}>'
\ No newline at end of file
+        return f'<Прогресс пользователя {self.user_id} за {self.date}>'
+
+
+# отметка о записанном пакете отложенных приращений прогресса
+class ProgressFlushBatch(db.Model):
+    id = db.Column(db.String(64), primary_key=True)
+    flushed_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<Пакет прогресса {self.id}>'
+
+# модель для рассчитанных показателей пользователя (BMR, TDEE, калории, БЖУ)
+class UserTargets(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    fingerprint = db.Column(db.String(40), nullable=False)
+    bmr = db.Column(db.Float, nullable=False)
+    tdee = db.Column(db.Float, nullable=False)
+    daily_calories = db.Column(db.Float, nullable=False)
+    protein = db.Column(db.Float, nullable=False)
+    fats = db.Column(db.Float, nullable=False)
+    carbs = db.Column(db.Float, nullable=False)
+
+    user = db.relationship('User', backref=db.backref('targets', uselist=False))
+
+    def to_dict(self):
+        return {
+            'bmr': self.bmr,
+            'tdee': self.tdee,
+            'daily_calories': self.daily_calories,
+            'protein': self.protein,
+            'fats': self.fats,
+            'carbs': self.carbs
+        }
+
+    def __repr__(self):
+        return f'<Показатели пользователя {self.user_id}>'
@@ -0,0 +1,58 @@
+import threading
+import time
+from flask import current_app
+
+# кеш шаблонов планов в памяти процесса.
+# шаблон — набор заранее выбранных вариантов плана (рецепты или упражнения),
+# который масштабируется под конкретного пользователя и чередуется по дням.
+class PlanTemplateCache:
+    def __init__(self):
+        self._templates = {}
+        self._lock = threading.Lock()
+        self._hits = {}
+        self._misses = {}
+
+    # получение шаблона по ключу; при отсутствии или устаревании он строится заново
+    def get(self, kind, key, builder):
+        if not current_app.config.get('PLAN_TEMPLATES_ENABLED', True):
+            return builder(1)
+
+        ttl = current_app.config.get('PLAN_TEMPLATE_TTL', 3600)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._templates.get((kind, key))
+            if entry and now - entry[0] < ttl:
+                self._hits[kind] = self._hits.get(kind, 0) + 1
+                return entry[1]
+            self._misses[kind] = self._misses.get(kind, 0) + 1
+
+        template = builder(current_app.config.get('PLAN_TEMPLATE_VARIANTS', 7))
+
+        with self._lock:
+            self._templates[(kind, key)] = (now, template)
+        return template
+
+    # метрики попаданий в кеш по видам шаблонов
+    def stats(self):
+        with self._lock:
+            stats = {}
+            for kind in sorted(set(self._hits) | set(self._misses)):
+                hits = self._hits.get(kind, 0)
+                misses = self._misses.get(kind, 0)
+                stats[kind] = {
+                    "hits": hits,
+                    "misses": misses,
+                    "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+                    "templates": sum(1 for template_kind, _ in self._templates if template_kind == kind)
+                }
+            return stats
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+            self._hits.clear()
+            self._misses.clear()
+
+
+plan_templates = PlanTemplateCache()
@@ -0,0 +1,337 @@
+import atexit
+import fcntl
+import json
+import logging
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import date as date_type, datetime, timedelta
+from sqlalchemy import select, insert, delete
+from app.models import UserProgress, ProgressFlushBatch, db
+
+# поля прогресса, которые изменяются приращениями
+PROGRESS_DELTA_FIELDS = ("total_calories_consumed", "total_calories_burned", "workouts_completed")
+
+# применение приращений прогресса в текущей сессии (без коммита)
+def apply_progress_deltas(pending):
+    if not pending:
+        return
+
+    user_ids = {user_id for user_id, _ in pending}
+    dates = {progress_date for _, progress_date in pending}
+    existing = {
+        (progress.user_id, progress.date): progress
+        for progress in UserProgress.query.filter(
+            UserProgress.user_id.in_(user_ids),
+            UserProgress.date.in_(dates)
+        ).all()
+    }
+
+    for key, deltas in pending.items():
+        user_progress = existing.get(key)
+        if user_progress:
+            # приращение на стороне базы данных, чтобы параллельные записи не терялись
+            for field, value in deltas.items():
+                setattr(user_progress, field, getattr(UserProgress, field) + value)
+        else:
+            user_id, progress_date = key
+            db.session.add(UserProgress(
+                user_id=user_id,
+                date=progress_date,
+                **{field: deltas.get(field, 0) for field in PROGRESS_DELTA_FIELDS}
+            ))
+
+# процессы, которые сейчас ведут журнал в каталоге (их блокировка занята)
+def active_journal_writers(journal_dir):
+    active = []
+    for name in sorted(os.listdir(journal_dir)):
+        if not name.endswith('.lock'):
+            continue
+        with open(os.path.join(journal_dir, name), 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                active.append(name[:-len('.lock')])
+    return active
+
+# отложенная запись прогресса: приращения объединяются по (пользователь, дата)
+# и записываются одной транзакцией по таймеру или при накоплении порога.
+# каждое приращение сначала попадает в журнал на диске, поэтому после падения
+# процесса незаписанные приращения восстанавливаются при следующем запуске.
+# незаписанные приращения хранятся в памяти процесса, поэтому режим рассчитан
+# на один процесс приложения: запуск второго процесса с тем же журналом отклоняется.
+class ProgressWriteBehind:
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self._pending = {}
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._journal = None
+        self._journal_path = None
+        self._lock_file = None
+        self._token = None
+        self._segment = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config.get('PROGRESS_WRITE_BEHIND', False):
+            self.app = app
+            self.enabled = False
+            return
+
+        journal_dir = app.config.get('PROGRESS_JOURNAL_DIR') or os.path.join(app.instance_path, 'progress_journal')
+        os.makedirs(journal_dir, exist_ok=True)
+        active = active_journal_writers(journal_dir)
+        if active:
+            raise RuntimeError(
+                f"Отложенная запись прогресса поддерживает только один процесс приложения, "
+                f"журнал {journal_dir} уже используется: {', '.join(active)}."
+            )
+
+        self.app = app
+        self.enabled = True
+        self._pending = {}
+        self._in_flight = set()
+        self._segment = 0
+        self._stopped.clear()
+        self._wakeup.clear()
+
+        self.flush_interval = app.config.get('PROGRESS_FLUSH_INTERVAL', 0.5)
+        self.max_pending = app.config.get('PROGRESS_FLUSH_MAX_PENDING', 200)
+        self.fsync = app.config.get('PROGRESS_JOURNAL_FSYNC', True)
+        self.journal_dir = journal_dir
+
+        self._token = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._lock_file = open(os.path.join(self.journal_dir, f"{self._token}.lock"), 'w')
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        self.recover()
+        self._open_segment()
+
+        self._thread = threading.Thread(target=self._run, name='progress-write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    # регистрация приращений прогресса
+    def record(self, user_id, progress_date, **deltas):
+        if not self.enabled:
+            apply_progress_deltas({(user_id, progress_date): deltas})
+            db.session.commit()
+            return
+
+        with self._lock:
+            self._write_journal(user_id, progress_date, deltas)
+            pending = self._pending.setdefault((user_id, progress_date), {})
+            for field, value in deltas.items():
+                pending[field] = pending.get(field, 0) + value
+            size = len(self._pending)
+
+        if size >= self.max_pending:
+            self._wakeup.set()
+
+    # фиксация изменений текущей сессии (отметки плана) вместе с их приращениями прогресса:
+    # снимок прогресса видит либо и то и другое, либо ничего. без отложенной записи это
+    # одна транзакция, с отложенной — коммит и постановка в очередь под блокировкой снимка
+    def commit_with_progress(self, user_id, progress_date, **deltas):
+        if not self.enabled:
+            self.record(user_id, progress_date, **deltas)
+            return
+
+        with self._snapshot_lock:
+            db.session.commit()
+            self.record(user_id, progress_date, **deltas)
+
+    # согласованное чтение прогресса пользователя: приращения записаны в базу,
+    # а изменения с еще не поставленными в очередь приращениями не фиксируются
+    @contextmanager
+    def snapshot(self, user_id, progress_date):
+        if not self.enabled:
+            yield
+            return
+
+        with self._snapshot_lock:
+            self.flush_user(user_id, progress_date)
+            yield
+
+    # есть ли незаписанные приращения для пользователя за дату,
+    # включая приращения пакета, который записывается в данный момент
+    def has_pending(self, user_id, progress_date):
+        with self._lock:
+            key = (user_id, progress_date)
+            return key in self._pending or key in self._in_flight
+
+    # запись накопленных приращений пользователя перед чтением: запросы, обслуженные
+    # этим процессом, видят свои записи. flush() ждет завершения уже идущей записи,
+    # поэтому после возврата приращения в базе
+    def flush_user(self, user_id, progress_date):
+        if self.enabled and self.has_pending(user_id, progress_date):
+            self.flush()
+
+    # запись всех накопленных приращений одной транзакцией
+    def flush(self):
+        if not self.enabled:
+            return 0
+
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                pending, self._pending = self._pending, {}
+                self._in_flight = set(pending)
+                segment_path = self._journal_path
+                self._journal.close()
+                self._open_segment()
+
+            batch_id = os.path.basename(segment_path)
+            count = len(pending)
+            try:
+                self._commit_batch(batch_id, pending)
+            except Exception as e:
+                # в pending остались только приращения шардов, транзакция которых не зафиксирована
+                logging.error(f"Ошибка при записи прогресса ({len(pending)} из {count} записей), повтор позже: {e}")
+                with self._lock:
+                    for (user_id, progress_date), deltas in pending.items():
+                        self._write_journal(user_id, progress_date, deltas)
+                        current = self._pending.setdefault((user_id, progress_date), {})
+                        for field, value in deltas.items():
+                            current[field] = current.get(field, 0) + value
+                    self._in_flight = set()
+                os.remove(segment_path)
+                return 0
+
+            with self._lock:
+                self._in_flight = set()
+            os.remove(segment_path)
+            return count
+
+    # корректная остановка: запись оставшихся приращений
+    def shutdown(self):
+        if not self.enabled or self._stopped.is_set():
+            return
+
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+        with self._lock:
+            self._journal.close()
+            os.remove(self._journal_path)
+        self._lock_file.close()
+        os.remove(os.path.join(self.journal_dir, f"{self._token}.lock"))
+
+    # восстановление приращений из журналов завершившихся процессов
+    def recover(self):
+        for name in sorted(os.listdir(self.journal_dir)):
+            if not name.endswith('.lock') or name == f"{self._token}.lock":
+                continue
+
+            lock_path = os.path.join(self.journal_dir, name)
+            with open(lock_path, 'w') as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+
+                token = name[:-len('.lock')]
+                for segment_name in sorted(os.listdir(self.journal_dir)):
+                    if segment_name.startswith(f"{token}.") and segment_name.endswith('.log'):
+                        self._recover_segment(os.path.join(self.journal_dir, segment_name))
+
+            os.remove(lock_path)
+
+    def _recover_segment(self, segment_path):
+        batch_id = os.path.basename(segment_path)
+        pending = {}
+        with open(segment_path) as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # недописанная строка в момент падения
+                    continue
+                key = (entry['user_id'], date_type.fromisoformat(entry['date']))
+                current = pending.setdefault(key, {})
+                for field, value in entry['deltas'].items():
+                    current[field] = current.get(field, 0) + value
+
+        if pending:
+            logging.info(f"Восстановление {len(pending)} незаписанных приращений прогресса из {batch_id}.")
+            self._commit_batch(batch_id, pending)
+        os.remove(segment_path)
+
+    # приращения по шардам: при шардировании у каждого шарда своя транзакция и своя отметка о пакете
+    def _shard_groups(self, pending):
+        sharding = self.app.extensions.get('sharding')
+        if sharding is None:
+            return {None: dict(pending)}
+
+        groups = {}
+        for (user_id, progress_date), deltas in pending.items():
+            groups.setdefault(sharding.shard_for_user(user_id), {})[(user_id, progress_date)] = deltas
+        return groups
+
+    # запись пакета: приращения и отметка о пакете фиксируются одной транзакцией (в каждом шарде).
+    # зафиксированные приращения удаляются из pending, чтобы при ошибке повторить только остальные
+    def _commit_batch(self, batch_id, pending):
+        with self.app.app_context():
+            for shard, group in self._shard_groups(pending).items():
+                bind_arguments = {"shard_id": shard} if shard else None
+                try:
+                    committed = db.session.execute(
+                        select(ProgressFlushBatch.id).where(ProgressFlushBatch.id == batch_id),
+                        bind_arguments=bind_arguments
+                    ).first()
+                    if committed:
+                        logging.debug(f"Пакет прогресса {batch_id} уже записан ({shard or 'основная база'}), пропускаем.")
+                    else:
+                        apply_progress_deltas(group)
+                        flushed_at = datetime.utcnow()
+                        db.session.execute(
+                            insert(ProgressFlushBatch).values(id=batch_id, flushed_at=flushed_at),
+                            bind_arguments=bind_arguments
+                        )
+                        db.session.execute(
+                            delete(ProgressFlushBatch).where(ProgressFlushBatch.flushed_at < flushed_at - timedelta(days=1)),
+                            bind_arguments=bind_arguments
+                        )
+                        db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    raise
+
+                for key in group:
+                    pending.pop(key)
+
+    def _open_segment(self):
+        self._segment += 1
+        self._journal_path = os.path.join(self.journal_dir, f"{self._token}.{self._segment:08d}.log")
+        self._journal = open(self._journal_path, 'a')
+
+    def _write_journal(self, user_id, progress_date, deltas):
+        entry = {"user_id": user_id, "date": progress_date.isoformat(), "deltas": deltas}
+        self._journal.write(json.dumps(entry) + "\n")
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Ошибка фоновой записи прогресса: {e}")
+
+
+progress_writer = ProgressWriteBehind()
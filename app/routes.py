@@ -1,10 +1,17 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, Response
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 import jwt
+from sqlalchemy.exc import IntegrityError, OperationalError
 from datetime import timedelta, datetime
 from app.models import User, MealPlan, WorkoutPlan, UserProgress, Exercise, Recipe, db
-from app.utils import calculate_bmr, calculate_tdee, calculate_calories, generate_meal_plan, generate_workout_plan, calculate_bju
+from app.utils import get_user_targets, invalidate_user_targets, generate_meal_plan, generate_workout_plan, TARGET_INPUT_FIELDS
+from app.cohort import calculate_cohort_statistics
+from app.progress_queue import progress_writer
+from app.archive import get_meal_plan_history, get_workout_plan_history
+from app.plan_templates import plan_templates
+from app.events import progress_events
+from app.dashboard import build_dashboard
 import re
 import logging
 
@@ -49,6 +56,10 @@ def register():
         db.session.add(new_user)
         db.session.commit()
         return jsonify({"msg": "Пользователь успешно зарегистрирован"}), 201
+    except IntegrityError:
+        # логин занял параллельный запрос
+        db.session.rollback()
+        return jsonify({"msg": "Этот логин уже занят"}), 400
     except Exception as e:
         return handle_db_commit_error(e)
     
@@ -83,10 +94,7 @@ def get_profile():
     if not user:
         return jsonify({"msg": "Пользователь не найден"}), 404
 
-    bmr = calculate_bmr(user)
-    tdee = calculate_tdee(user)
-    daily_calories = calculate_calories(user)
-    bju = calculate_bju(user)
+    targets = get_user_targets(user)
 
     training_days = user.training_days.split(',') if user.training_days else []
 
@@ -102,12 +110,12 @@ def get_profile():
         "gender": user.gender,
         "diet_preference": user.diet_preference,
         "training_days": training_days,
-        "bmr": bmr,
-        "tdee": tdee,
-        "daily_calories": daily_calories,
-        "protein": bju["protein"],
-        "fats": bju["fats"],
-        "carbs": bju["carbs"]
+        "bmr": targets["bmr"],
+        "tdee": targets["tdee"],
+        "daily_calories": targets["daily_calories"],
+        "protein": targets["protein"],
+        "fats": targets["fats"],
+        "carbs": targets["carbs"]
     }
     return jsonify(profile_data), 200
 
@@ -126,6 +134,9 @@ def update_profile():
     try:
         update_user_profile(user, data)
         return jsonify({"msg": "Профиль успешно обновлен"}), 200
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"msg": "Этот логин уже занят"}), 400
     except Exception as e:
         return handle_db_commit_error(e)
 
@@ -220,6 +231,61 @@ def get_workout_plan():
     logging.debug(f"Ответ после генерации плана тренировок: {workout_plan_response}")
     return jsonify(workout_plan_response), 200
 
+# история планов питания за период (включая архив)
+@bp.route('/meal-plan/history', methods=['GET'])
+@jwt_required()
+def get_meal_plan_history_route():
+    user_id = get_jwt_identity()
+    user = get_user_profile(user_id)
+
+    if not user:
+        return jsonify({"msg": "Пользователь не найден"}), 404
+
+    start, end, error_message = parse_date_range(request.args)
+    if error_message:
+        return jsonify({"msg": error_message}), 400
+
+    return jsonify(get_meal_plan_history(user.id, start, end)), 200
+
+# история планов тренировок за период (включая архив)
+@bp.route('/workout-plan/history', methods=['GET'])
+@jwt_required()
+def get_workout_plan_history_route():
+    user_id = get_jwt_identity()
+    user = get_user_profile(user_id)
+
+    if not user:
+        return jsonify({"msg": "Пользователь не найден"}), 404
+
+    start, end, error_message = parse_date_range(request.args)
+    if error_message:
+        return jsonify({"msg": error_message}), 400
+
+    return jsonify(get_workout_plan_history(user.id, start, end)), 200
+
+# сводка за неделю: показатели, планы питания и тренировок, прогресс (только чтение)
+@bp.route('/dashboard', methods=['GET'])
+@jwt_required()
+def get_dashboard():
+    user_id = get_jwt_identity()
+    user = get_user_profile(user_id)
+
+    if not user:
+        return jsonify({"msg": "Пользователь не найден"}), 404
+
+    if request.args.get('start') or request.args.get('end'):
+        start, end, error_message = parse_date_range(request.args, max_days=31)
+        if error_message:
+            return jsonify({"msg": error_message}), 400
+    else:
+        today = datetime.utcnow().date()
+        start = today - timedelta(days=today.weekday())
+        end = start + timedelta(days=6)
+
+    progress_writer.flush_user(user.id, datetime.utcnow().date())
+
+    return jsonify(build_dashboard(user, start, end)), 200
+
 # получение прогресса пользователя
 @bp.route('/user-progress', methods=['GET'])
 @jwt_required()
@@ -233,6 +299,8 @@ def get_user_progress():
 
     logging.debug(f"Получение прогресса пользователя {user.username} за {datetime.utcnow().date()}.")
 
+    progress_writer.flush_user(user.id, datetime.utcnow().date())
+
     user_progress = UserProgress.query.filter_by(user_id=user.id, date=datetime.utcnow().date()).first()
 
     if not user_progress:
@@ -277,6 +345,33 @@ def get_user_progress():
 
     return jsonify(progress_response), 200
 
+# поток изменений прогресса (Server-Sent Events) вместо опроса /user-progress
+# EventSource не передает заголовки, поэтому токен можно указать в параметре ?jwt=
+@bp.route('/user-progress/stream', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def stream_user_progress():
+    user_id = get_jwt_identity()
+    user = get_user_profile(user_id)
+
+    if not user:
+        return jsonify({"msg": "Пользователь не найден"}), 404
+
+    # подписка до чтения снимка: изменения после нее не теряются. события, уже учтенные
+    # в снимке, не передаются повторно: опубликованные до подписки — по id события,
+    # опубликованные между подпиской и чтением снимка — по id отмеченных планов
+    subscription = progress_events.subscribe(user.id)
+    snapshot = get_progress_snapshot(user.id, datetime.utcnow().date())
+    snapshot["last_event_id"] = subscription.last_event_id
+    subscription.mark_counted("meal_plan_id", snapshot["eaten_meal_ids"])
+    subscription.mark_counted("workout_plan_id", snapshot["completed_workout_ids"])
+    db.session.remove()
+
+    return Response(
+        progress_events.stream(subscription, snapshot),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 # ежедневный сброс прогресса
 @bp.route('/user-progress', methods=['POST'])
 @jwt_required()
@@ -290,6 +385,8 @@ def reset_user_progress():
 
     logging.debug(f"Обнуление прогресса пользователя {user.username} за {datetime.utcnow().date()}.")
 
+    progress_writer.flush_user(user.id, datetime.utcnow().date())
+
     user_progress = UserProgress.query.filter_by(user_id=user.id, date=datetime.utcnow().date()).first()
 
     if not user_progress:
@@ -314,6 +411,8 @@ def reset_user_progress():
 
     db.session.commit()
 
+    progress_events.publish(user.id, {"type": "progress_reset", "date": user_progress.date.isoformat()})
+
     return jsonify({"msg": "Прогресс успешно обнулен"}), 200
 
 # для пометки съеденного приема пищи
@@ -327,21 +426,23 @@ def mark_meal_as_eaten():
     if not meal_plan:
         return jsonify({"msg": "План питания не найден"}), 404
 
-    meal_plan.eaten = True
-    db.session.commit()
+    if meal_plan.eaten:
+        return jsonify({"msg": "Прием пищи уже отмечен как съеденный."}), 400
 
-    user_progress = UserProgress.query.filter_by(user_id=meal_plan.user_id, date=datetime.utcnow().date()).first()
-    if user_progress:
-        user_progress.total_calories_consumed += meal_plan.calories
-    else:
-        new_progress = UserProgress(
-            user_id=meal_plan.user_id,
-            date=datetime.utcnow().date(),
-            total_calories_consumed=meal_plan.calories
-        )
-        db.session.add(new_progress)
-
-    db.session.commit()
+    meal_plan.eaten = True
+    progress_writer.commit_with_progress(meal_plan.user_id, datetime.utcnow().date(), total_calories_consumed=meal_plan.calories)
+
+    progress_events.publish(meal_plan.user_id, {
+        "type": "meal_eaten",
+        "date": datetime.utcnow().date().isoformat(),
+        "meal_plan_id": meal_plan.id,
+        "delta": {
+            "total_calories_consumed": meal_plan.calories,
+            "total_protein_consumed": meal_plan.protein,
+            "total_carbs_consumed": meal_plan.carbs,
+            "total_fats_consumed": meal_plan.fats
+        }
+    })
 
     return jsonify({"msg": "Прием пищи отмечен как съеденный"}), 200
 
@@ -360,22 +461,22 @@ def mark_workout_as_completed():
         return jsonify({"msg": "Тренировка уже завершена."}), 400
 
     workout_plan.completed = True
-    db.session.commit()
-
-    user_progress = UserProgress.query.filter_by(user_id=workout_plan.user_id, date=datetime.utcnow().date()).first()
-    if user_progress:
-        user_progress.total_calories_burned += workout_plan.duration * 10
-        user_progress.workouts_completed += 1 
-    else:
-        new_progress = UserProgress(
-            user_id=workout_plan.user_id,
-            date=datetime.utcnow().date(),
-            total_calories_burned=workout_plan.duration * 10,
-            workouts_completed=1
-        )
-        db.session.add(new_progress)
+    progress_writer.commit_with_progress(
+        workout_plan.user_id,
+        datetime.utcnow().date(),
+        total_calories_burned=workout_plan.duration * 10,
+        workouts_completed=1
+    )
 
-    db.session.commit()
+    progress_events.publish(workout_plan.user_id, {
+        "type": "workout_completed",
+        "date": datetime.utcnow().date().isoformat(),
+        "workout_plan_id": workout_plan.id,
+        "delta": {
+            "total_calories_burned": workout_plan.duration * 10,
+            "workouts_completed": 1
+        }
+    })
 
     return jsonify({"msg": "Тренировка помечена как завершенная"}), 200
 
@@ -441,6 +542,30 @@ def get_exercise_instruction(exercise_id):
     }), 200
 
 
+# статистика по когорте пользователей (только для администраторов)
+@bp.route('/admin/cohort-stats', methods=['GET'])
+@jwt_required()
+def get_cohort_stats():
+    user_id = get_jwt_identity()
+    user = get_user_profile(user_id)
+
+    if not user or not is_admin(user):
+        return jsonify({"msg": "Доступ запрещен"}), 403
+
+    return jsonify(calculate_cohort_statistics()), 200
+
+# метрики кеша шаблонов планов (только для администраторов)
+@bp.route('/admin/plan-templates/stats', methods=['GET'])
+@jwt_required()
+def get_plan_template_stats():
+    user_id = get_jwt_identity()
+    user = get_user_profile(user_id)
+
+    if not user or not is_admin(user):
+        return jsonify({"msg": "Доступ запрещен"}), 403
+
+    return jsonify(plan_templates.stats()), 200
+
 # проверка токена
 @bp.route('/api/check-token', methods=['GET'])
 def check_token():
@@ -468,6 +593,37 @@ def is_valid_token(token):
     except jwt.InvalidTokenError:
         return False
 
+# снимок прогресса за день для потока изменений вместе с id учтенных в нем отметок.
+# калории тренировок берутся из прогресса, поэтому список выполненных тренировок
+# перечитывается: если он изменился во время чтения, снимок читается заново
+def get_progress_snapshot(user_id, day):
+    with progress_writer.snapshot(user_id, day):
+        completed_workout_ids = read_completed_workout_ids(user_id, day)
+        while True:
+            user_progress = UserProgress.query.filter_by(user_id=user_id, date=day).populate_existing().first()
+            meal_plans = MealPlan.query.filter_by(user_id=user_id, date=day, eaten=True).all()
+            reread_ids = read_completed_workout_ids(user_id, day)
+            if reread_ids == completed_workout_ids:
+                break
+            completed_workout_ids = reread_ids
+
+    return {
+        "date": day.isoformat(),
+        "total_calories_consumed": sum(meal.calories for meal in meal_plans),
+        "total_calories_burned": user_progress.total_calories_burned if user_progress else 0,
+        "workouts_completed": user_progress.workouts_completed if user_progress else 0,
+        "total_protein_consumed": sum(meal.protein for meal in meal_plans),
+        "total_carbs_consumed": sum(meal.carbs for meal in meal_plans),
+        "total_fats_consumed": sum(meal.fats for meal in meal_plans),
+        "eaten_meal_ids": sorted(meal.id for meal in meal_plans),
+        "completed_workout_ids": completed_workout_ids,
+    }
+
+def read_completed_workout_ids(user_id, day):
+    return sorted(
+        workout_id for workout_id, in db.session.query(WorkoutPlan.id).filter_by(user_id=user_id, date=day, completed=True)
+    )
+
 # валидация
 def validate_user_data(data):
     required_fields = ['username', 'password', 'confirm_password', 'age', 'weight', 'height', 'activity_level', 'goal', 'first_name', 'last_name', 'gender']
@@ -512,15 +668,41 @@ def validate_user_data(data):
 
     return None, None
 
+# разбор периода из параметров запроса (start, end в формате ГГГГ-ММ-ДД)
+def parse_date_range(args, max_days=366):
+    today = datetime.utcnow().date()
+    try:
+        end = datetime.strptime(args['end'], '%Y-%m-%d').date() if args.get('end') else today
+        start = datetime.strptime(args['start'], '%Y-%m-%d').date() if args.get('start') else end - timedelta(days=6)
+    except ValueError:
+        return None, None, "Некорректный формат даты, ожидается ГГГГ-ММ-ДД"
+
+    if start > end:
+        return None, None, "Дата начала периода позже даты окончания"
+    if (end - start).days >= max_days:
+        return None, None, f"Период не может превышать {max_days} дней"
+
+    return start, end, None
+
 # обработка ошибок
 def handle_db_commit_error(e):
     db.session.rollback()
     return jsonify({"msg": f"Ошибка при обработке данных: {str(e)}"}), 500
 
+# ошибки SQLite в маршрутах без собственной обработки; блокировка базы отдается как 503
+# с признаком database_locked, чтобы клиент (и нагрузочный тест) мог отличить ее от других ошибок
+@bp.app_errorhandler(OperationalError)
+def handle_operational_error(e):
+    db.session.rollback()
+    if "database is locked" in str(e):
+        logging.warning(f"База данных заблокирована: {request.method} {request.path}")
+        return jsonify({"msg": "База данных занята, повторите запрос", "error": "database_locked"}), 503, {"Retry-After": "1"}
+    return handle_db_commit_error(e)
+
 # создание токена
 def create_jwt_token(user):
     return create_access_token(
-        identity=user.id,
+        identity=str(user.id),
         additional_claims={
             "age": user.age,
             "weight": user.weight,
@@ -531,10 +713,17 @@ def create_jwt_token(user):
         expires_delta=timedelta(days=3)
     )
 
+def is_admin(user):
+    return user.username in current_app.config.get('ADMIN_USERNAMES', [])
+
 def get_user_profile(user_id):
-    return User.query.get(user_id)
+    return User.query.get(int(user_id))
 
 def update_user_profile(user, data):
     for field, value in data.items():
         setattr(user, field, value)
+
+    if any(field in data for field in TARGET_INPUT_FIELDS):
+        invalidate_user_targets(user)
+
     db.session.commit()
\ No newline at end of file
@@ -0,0 +1,452 @@
+import fcntl
+import hashlib
+import logging
+import os
+import sqlalchemy as sa
+from datetime import datetime, timedelta
+from flask import current_app
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import event
+from sqlalchemy.ext.horizontal_shard import ShardedSession
+from sqlalchemy.sql import operators
+
+# шардирование пользовательских таблиц по нескольким файлам SQLite.
+#
+# строки User, UserTargets, MealPlan, WorkoutPlan и UserProgress хранятся в шарде,
+# выбранном по хешу user_id; каталог (Recipe, Exercise) и служебные таблицы остаются
+# в основной базе, которая подключается к каждому шарду через ATTACH, поэтому
+# запросы с join на каталог работают внутри шарда.
+#
+# идентификаторы пользователей выдаются общей последовательностью в основной базе,
+# идентификаторы строк планов и прогресса — последовательностью шарда, начинающейся
+# с index * SHARD_ID_SPAN, поэтому по id строки можно определить ее шард.
+# логины резервируются в реестре основной базы той же транзакцией, что и id,
+# поэтому логин уникален во всех шардах. резерв фиксируется до записи в шард;
+# резервы, для которых пользователь так и не появился в шарде (процесс упал между
+# двумя коммитами), удаляются при запуске приложения.
+#
+# при включении шардирования на существующей установке пользователи из основной
+# базы переносятся в шарды при запуске приложения.
+
+CATALOG_SHARD = "catalog"
+SHARD_ID_SPAN = 10 ** 12
+
+# таблицы, строки которых распределяются по шардам
+SHARDED_TABLES = ("user", "user_targets", "meal_plan", "workout_plan", "user_progress")
+# таблицы с собственной последовательностью id в каждом шарде
+SHARD_SEQUENCE_TABLES = ("meal_plan", "workout_plan", "user_progress")
+# служебные таблицы, которые есть в каждом шарде, но не привязаны к пользователю
+SHARD_LOCAL_TABLES = ("progress_flush_batch",)
+
+sequence_metadata = sa.MetaData()
+user_id_sequence = sa.Table(
+    "user_id_sequence", sequence_metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sqlite_autoincrement=True
+)
+username_registry = sa.Table(
+    "username_registry", sequence_metadata,
+    sa.Column("username", sa.String(80), primary_key=True),
+    sa.Column("user_id", sa.Integer, nullable=False, index=True),
+    sa.Column("reserved_at", sa.DateTime, nullable=False, server_default=sa.func.current_timestamp())
+)
+
+def shard_name(index):
+    return f"shard_{index}"
+
+def shard_index_for_user(user_id, shard_count):
+    digest = hashlib.md5(str(int(user_id)).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % shard_count
+
+def shard_index_for_row(row_id):
+    return int(row_id) // SHARD_ID_SPAN
+
+# целочисленный id из значения первичного ключа (None для отсутствующих и нечисловых значений)
+def integer_id(value):
+    if isinstance(value, bool):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def shard_database_path(catalog_path, index):
+    directory, filename = os.path.split(catalog_path)
+    stem, extension = os.path.splitext(filename)
+    return os.path.join(directory, f"{stem}_shard{index}{extension or '.db'}")
+
+# создание движка шарда с подключенной основной базой
+def create_shard_engine(catalog_path, index):
+    engine = sa.create_engine(f"sqlite:///{shard_database_path(catalog_path, index)}")
+
+    @event.listens_for(engine, "connect")
+    def attach_catalog(dbapi_connection, connection_record):
+        dbapi_connection.execute("ATTACH DATABASE ? AS catalog", (catalog_path,))
+
+    return engine
+
+# создание таблиц шарда и начального значения последовательностей id
+def create_shard_schema(engine, metadata, index):
+    shard_metadata = sa.MetaData()
+    for table in metadata.tables.values():
+        table.to_metadata(shard_metadata)
+    for name in SHARD_SEQUENCE_TABLES:
+        shard_metadata.tables[name].dialect_kwargs['sqlite_autoincrement'] = True
+    shard_metadata.create_all(engine, tables=[shard_metadata.tables[name] for name in SHARDED_TABLES + SHARD_LOCAL_TABLES])
+
+    with engine.begin() as connection:
+        for name in SHARD_SEQUENCE_TABLES:
+            exists = connection.execute(
+                sa.text("SELECT 1 FROM sqlite_sequence WHERE name = :name"), {"name": name}
+            ).first()
+            if not exists:
+                connection.execute(
+                    sa.text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"),
+                    {"name": name, "seq": index * SHARD_ID_SPAN}
+                )
+
+class Sharding:
+    def __init__(self, app, db):
+        self.db = db
+        self.shard_count = app.config['SHARD_COUNT']
+        self.reservation_grace = app.config.get('SHARD_USERNAME_RESERVATION_GRACE', 300)
+
+        with app.app_context():
+            self.catalog_engine = db.engine
+            self.catalog_path = db.engine.url.database
+            sequence_metadata.create_all(self.catalog_engine)
+
+            self.engines = {}
+            for index in range(self.shard_count):
+                engine = create_shard_engine(self.catalog_path, index)
+                create_shard_schema(engine, db.metadata, index)
+                self.engines[shard_name(index)] = engine
+
+        self.prepare()
+
+    @property
+    def shards(self):
+        return {CATALOG_SHARD: self.catalog_engine, **self.engines}
+
+    def shard_for_user(self, user_id):
+        return shard_name(shard_index_for_user(user_id, self.shard_count))
+
+    # шард строки по ее id; для id, которые не являются целыми числами, строки нет ни в одном шарде
+    def shard_for_row(self, row_id):
+        row_id = integer_id(row_id)
+        if row_id is None:
+            return []
+        name = shard_name(shard_index_for_row(row_id))
+        return [name] if name in self.engines else []
+
+    # подготовка при запуске под файловой блокировкой (процессы приложения выполняют ее по очереди)
+    def prepare(self):
+        with open(f"{self.catalog_path}.sharding.lock", 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self.seed_user_id_sequence()
+            migrated = migrate_catalog_users(self)
+            if migrated:
+                logging.info(f"Перенесено пользователей из основной базы в шарды: {migrated}.")
+            self.reconcile_username_registry()
+
+        remaining = self.catalog_user_count()
+        if remaining:
+            raise RuntimeError(f"В основной базе остались пользователи, не перенесенные в шарды: {remaining}.")
+
+    def catalog_user_count(self):
+        with self.catalog_engine.connect() as connection:
+            return connection.execute(sa.select(sa.func.count()).select_from(self.db.metadata.tables["user"])).scalar()
+
+    # продолжение общей последовательности id после максимального существующего id пользователя
+    def seed_user_id_sequence(self):
+        user = self.db.metadata.tables["user"]
+        max_user_id = 0
+        for engine in [self.catalog_engine, *self.engines.values()]:
+            with engine.connect() as connection:
+                max_user_id = max(max_user_id, connection.execute(sa.select(sa.func.max(user.c.id))).scalar() or 0)
+
+        with self.catalog_engine.begin() as connection:
+            seq = connection.execute(
+                sa.text("SELECT seq FROM sqlite_sequence WHERE name = 'user_id_sequence'")
+            ).scalar()
+            if seq is None:
+                connection.execute(
+                    sa.text("INSERT INTO sqlite_sequence (name, seq) VALUES ('user_id_sequence', :seq)"),
+                    {"seq": max_user_id}
+                )
+            elif seq < max_user_id:
+                connection.execute(
+                    sa.text("UPDATE sqlite_sequence SET seq = :seq WHERE name = 'user_id_sequence'"),
+                    {"seq": max_user_id}
+                )
+
+    # сверка реестра логинов с шардами: добавление пользователей, созданных до появления реестра,
+    # и удаление резервов без пользователя в шарде. недавние резервы не трогаются:
+    # их запись в шард может еще выполняться в другом процессе
+    def reconcile_username_registry(self):
+        user = self.db.metadata.tables["user"]
+        entries = set()
+        for engine in self.engines.values():
+            with engine.connect() as connection:
+                entries.update(tuple(row) for row in connection.execute(sa.select(user.c.username, user.c.id)))
+
+        cutoff = datetime.utcnow() - timedelta(seconds=self.reservation_grace)
+        with self.catalog_engine.begin() as connection:
+            registered = connection.execute(
+                sa.select(username_registry.c.username, username_registry.c.user_id, username_registry.c.reserved_at)
+            ).all()
+
+            orphans = [
+                (username, user_id) for username, user_id, reserved_at in registered
+                if (username, user_id) not in entries and reserved_at < cutoff
+            ]
+            for username, user_id in orphans:
+                connection.execute(username_registry.delete().where(
+                    username_registry.c.username == username,
+                    username_registry.c.user_id == user_id
+                ))
+            if orphans:
+                logging.warning(f"Удалены резервы логинов без пользователя в шардах: {len(orphans)}.")
+
+            missing = entries - {(username, user_id) for username, user_id, _ in registered}
+            for username, user_id in missing:
+                connection.execute(
+                    username_registry.insert().prefix_with("OR IGNORE"),
+                    {"username": username, "user_id": user_id}
+                )
+
+    # выдача id новым пользователям и резервирование их логинов одной транзакцией основной базы.
+    # занятый логин нарушает первичный ключ реестра (IntegrityError)
+    def register_users(self, usernames):
+        with self.catalog_engine.begin() as connection:
+            user_ids = [
+                connection.execute(user_id_sequence.insert()).inserted_primary_key[0]
+                for _ in usernames
+            ]
+            connection.execute(username_registry.insert(), [
+                {"username": username, "user_id": user_id}
+                for username, user_id in zip(usernames, user_ids)
+            ])
+        return user_ids
+
+    def reserve_username(self, username, user_id):
+        with self.catalog_engine.begin() as connection:
+            connection.execute(username_registry.insert(), {"username": username, "user_id": user_id})
+
+    def release_usernames(self, entries):
+        with self.catalog_engine.begin() as connection:
+            for username, user_id in entries:
+                connection.execute(username_registry.delete().where(
+                    username_registry.c.username == username,
+                    username_registry.c.user_id == user_id
+                ))
+
+    # выбор шарда для новой строки
+    def shard_chooser(self, mapper, instance, clause=None):
+        table = mapper.local_table.name
+        if table not in SHARDED_TABLES or instance is None:
+            return CATALOG_SHARD
+        if table == "user":
+            return self.shard_for_user(instance.id)
+        return self.shard_for_user(instance.user_id)
+
+    # выбор шардов для поиска по первичному ключу
+    def identity_chooser(self, mapper, primary_key, **kw):
+        table = mapper.local_table.name
+        if table not in SHARDED_TABLES:
+            return [CATALOG_SHARD]
+        if table in ("user", "user_targets"):
+            user_id = integer_id(primary_key[0])
+            return [self.shard_for_user(user_id)] if user_id is not None else []
+        return self.shard_for_row(primary_key[0])
+
+    # выбор шардов для запроса: по условиям на user_id или id, иначе все шарды
+    def execute_chooser(self, orm_context):
+        tables = {mapper.local_table.name for mapper in orm_context.all_mappers}
+        if not tables & set(SHARDED_TABLES):
+            return [CATALOG_SHARD]
+
+        whereclause = getattr(orm_context.statement, 'whereclause', None)
+        if whereclause is None:
+            return list(self.engines)
+
+        shards = set()
+        for column, values in _and_comparisons(whereclause, orm_context.parameters):
+            if column.table.name not in SHARDED_TABLES:
+                continue
+            if column.key == "user_id" or (column.table.name in ("user", "user_targets") and column.key == "id"):
+                shards.update(self.shard_for_user(value) for value in values)
+                break
+            if column.key == "id":
+                shards.update(name for value in values for name in self.shard_for_row(value))
+                break
+
+        return sorted(shards) if shards else list(self.engines)
+
+# условия вида column == value и column IN (...) верхнего уровня (только через AND)
+def _and_comparisons(whereclause, parameters):
+    clauses = whereclause.clauses if getattr(whereclause, 'operator', None) is operators.and_ else [whereclause]
+    parameters = parameters if isinstance(parameters, dict) else {}
+
+    for clause in clauses:
+        if not isinstance(clause, sa.BinaryExpression) or not isinstance(clause.left, sa.Column):
+            continue
+        if clause.operator not in (operators.eq, operators.in_op) or not isinstance(clause.right, sa.BindParameter):
+            continue
+
+        value = parameters.get(clause.right.key, clause.right.effective_value)
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        try:
+            yield clause.left, [int(item) for item in values if item is not None]
+        except (TypeError, ValueError):
+            continue
+
+class ShardedFlaskSession(ShardedSession, FlaskSession):
+    pass
+
+# выдача глобальных id новым пользователям до записи, чтобы по id определить шард,
+# и резервирование логинов (новых и измененных) в общем реестре
+@event.listens_for(ShardedFlaskSession, "before_flush")
+def assign_user_ids(session, flush_context, instances):
+    sharding = current_app.extensions['sharding']
+    reserved = session.info.setdefault('reserved_usernames', [])
+
+    new_users = [obj for obj in session.new if obj.__table__.name == "user"]
+    unnumbered = [user for user in new_users if user.id is None]
+    if unnumbered:
+        for user, user_id in zip(unnumbered, sharding.register_users([user.username for user in unnumbered])):
+            user.id = user_id
+            reserved.append((user.username, user_id))
+    for user in new_users:
+        if (user.username, user.id) not in reserved:
+            sharding.reserve_username(user.username, user.id)
+            reserved.append((user.username, user.id))
+
+    for user in session.dirty:
+        if user.__table__.name != "user":
+            continue
+        history = sa.inspect(user).attrs.username.history
+        if history.added and history.deleted:
+            sharding.reserve_username(user.username, user.id)
+            reserved.append((user.username, user.id))
+            session.info.setdefault('released_usernames', []).extend(
+                (username, user.id) for username in history.deleted
+            )
+
+# после коммита освобождаются прежние логины переименованных пользователей
+@event.listens_for(ShardedFlaskSession, "after_commit")
+def release_replaced_usernames(session):
+    session.info.pop('reserved_usernames', None)
+    released = session.info.pop('released_usernames', None)
+    if released:
+        current_app.extensions['sharding'].release_usernames(released)
+
+# при откате (или закрытии сессии без коммита) резерв логинов снимается
+@event.listens_for(ShardedFlaskSession, "after_transaction_end")
+def release_reserved_usernames(session, transaction):
+    if transaction.parent is not None:
+        return
+    session.info.pop('released_usernames', None)
+    reserved = session.info.pop('reserved_usernames', None)
+    if reserved:
+        current_app.extensions['sharding'].release_usernames(reserved)
+
+# сессия приложения: шардированная, если шардирование включено (SHARD_COUNT > 1)
+class RoutingSession(FlaskSession):
+    def __new__(cls, db=None, **kwargs):
+        sharding = current_app.extensions.get('sharding')
+        if sharding is None:
+            return super().__new__(cls)
+
+        return ShardedFlaskSession(
+            db=db,
+            shard_chooser=sharding.shard_chooser,
+            identity_chooser=sharding.identity_chooser,
+            execute_chooser=sharding.execute_chooser,
+            shards=sharding.shards,
+            **kwargs
+        )
+
+# перенос строк пользователя в другой шард: сначала запись в целевой шард, затем удаление
+# из исходного. строки планов и прогресса получают новые id из последовательности целевого шарда.
+# повторный запуск после сбоя безопасен: перед записью строки пользователя в целевом шарде удаляются.
+def _move_user(tables, source, target, user_id):
+    user = tables["user"]
+    with source.connect() as connection:
+        user_row = connection.execute(sa.select(user).where(user.c.id == user_id)).mappings().first()
+        rows = {
+            name: [dict(row) for row in connection.execute(
+                sa.select(tables[name]).where(tables[name].c.user_id == user_id)
+            ).mappings()]
+            for name in SHARDED_TABLES if name != "user"
+        }
+
+    with target.begin() as connection:
+        for name in reversed(SHARDED_TABLES):
+            table = tables[name]
+            column = table.c.id if name == "user" else table.c.user_id
+            connection.execute(table.delete().where(column == user_id))
+
+        connection.execute(user.insert(), [dict(user_row)])
+        for name, table_rows in rows.items():
+            if name in SHARD_SEQUENCE_TABLES:
+                for row in table_rows:
+                    row.pop("id")
+            if table_rows:
+                connection.execute(tables[name].insert(), table_rows)
+
+    with source.begin() as connection:
+        for name in reversed(SHARDED_TABLES):
+            table = tables[name]
+            column = table.c.id if name == "user" else table.c.user_id
+            connection.execute(table.delete().where(column == user_id))
+
+# перенос пользователей, оставшихся в основной базе с установки без шардирования.
+# id пользователей сохраняются, строки планов и прогресса получают id шарда
+def migrate_catalog_users(sharding):
+    tables = sharding.db.metadata.tables
+    with sharding.catalog_engine.connect() as connection:
+        user_ids = connection.execute(sa.select(tables["user"].c.id)).scalars().all()
+
+    for user_id in user_ids:
+        _move_user(tables, sharding.catalog_engine, sharding.engines[sharding.shard_for_user(user_id)], user_id)
+
+    return len(user_ids)
+
+# перераспределение пользователей после изменения SHARD_COUNT
+def rebalance_shards(sharding, previous_count):
+    tables = sharding.db.metadata.tables
+    report = {}
+
+    for index in range(max(previous_count, sharding.shard_count)):
+        name = shard_name(index)
+        if not os.path.exists(shard_database_path(sharding.catalog_path, index)):
+            continue
+
+        source = sharding.engines.get(name) or create_shard_engine(sharding.catalog_path, index)
+        with source.connect() as connection:
+            user_ids = connection.execute(sa.select(tables["user"].c.id)).scalars().all()
+
+        moved = 0
+        for user_id in user_ids:
+            target_name = sharding.shard_for_user(user_id)
+            if target_name == name:
+                continue
+            _move_user(tables, source, sharding.engines[target_name], user_id)
+            moved += 1
+
+        report[name] = {"users_before": len(user_ids), "users_moved": moved, "retired": name not in sharding.engines}
+        if name not in sharding.engines:
+            source.dispose()
+
+    return report
+
+def init_sharding(app, db):
+    app.extensions.pop('sharding', None)
+    if app.config.get('SHARD_COUNT', 1) <= 1:
+        return None
+
+    sharding = Sharding(app, db)
+    app.extensions['sharding'] = sharding
+    logging.info(f"Шардирование включено: {sharding.shard_count} шардов.")
+    return sharding
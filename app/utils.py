@@ -1,10 +1,44 @@
-from app.models import Recipe, MealPlan, WorkoutPlan, Exercise, db
+from flask import current_app
+from app.models import Recipe, MealPlan, WorkoutPlan, Exercise, UserTargets, db
+from app.plan_templates import plan_templates
+from sqlalchemy.exc import IntegrityError
 import random
+import hashlib
 from datetime import datetime, timedelta
 import logging
 
 logging.basicConfig(level=logging.DEBUG)
 
+# коэффициенты активности для расчета TDEE
+ACTIVITY_MULTIPLIER = {
+    "низкая": 1.2,
+    "средняя": 1.55,
+    "высокая": 1.9
+}
+
+# поправка калорийности в зависимости от цели
+GOAL_CALORIE_OFFSET = {
+    "похудение": -500,
+    "набор массы": 500
+}
+
+# доли дневной калорийности по приемам пищи
+MEAL_CALORIE_SHARES = {
+    "завтрак": 0.25,
+    "обед": 0.35,
+    "ужин": 0.25,
+    "перекус": 0.15
+}
+
+# макронутриент, рецепты с большей долей которого предпочтительны для цели
+GOAL_PREFERRED_MACRO = {
+    "похудение": "protein",
+    "набор массы": "carbs"
+}
+
+# поля профиля, от которых зависят рассчитанные показатели
+TARGET_INPUT_FIELDS = ("weight", "height", "age", "gender", "activity_level", "goal")
+
 # функция для расчета BMR
 def calculate_bmr(user):
     if user.gender == 'male':
@@ -14,26 +48,17 @@ def calculate_bmr(user):
 
 # функция для расчета TDEE
 def calculate_tdee(user):
-    activity_multiplier = {
-        "низкая": 1.2,
-        "средняя": 1.55,
-        "высокая": 1.9
-    }
-    return calculate_bmr(user) * activity_multiplier.get(user.activity_level, 1.2)
+    return calculate_bmr(user) * ACTIVITY_MULTIPLIER.get(user.activity_level, 1.2)
 
 # функция для расчета калорий
 def calculate_calories(user):
     tdee = calculate_tdee(user)
-    if user.goal == 'похудение':
-        return tdee - 500
-    elif user.goal == 'набор массы':
-        return tdee + 500
-    else:
-        return tdee
+    return tdee + GOAL_CALORIE_OFFSET.get(user.goal, 0)
 
 # функция для расчета БЖУ
-def calculate_bju(user):
-    tdee = calculate_tdee(user)
+def calculate_bju(user, tdee=None):
+    if tdee is None:
+        tdee = calculate_tdee(user)
     protein = (tdee * 0.30) / 4
     fats = (tdee * 0.25) / 9
     carbs = (tdee * 0.45) / 4
@@ -44,45 +69,204 @@ def calculate_bju(user):
         "carbs": round(carbs, 0)
     }
 
-# фильтрация рецептов по предпочтениям пользователя
-def filter_recipes(user):
+# расчет всех производных показателей за один проход (TDEE считается один раз)
+def calculate_targets(user):
+    bmr = calculate_bmr(user)
+    tdee = bmr * ACTIVITY_MULTIPLIER.get(user.activity_level, 1.2)
+    daily_calories = tdee + GOAL_CALORIE_OFFSET.get(user.goal, 0)
+    bju = calculate_bju(user, tdee)
+
+    return {
+        "bmr": bmr,
+        "tdee": tdee,
+        "daily_calories": daily_calories,
+        "protein": bju["protein"],
+        "fats": bju["fats"],
+        "carbs": bju["carbs"]
+    }
+
+# отпечаток параметров профиля, от которых зависят показатели
+def targets_fingerprint(user):
+    values = "|".join(repr(getattr(user, field)) for field in TARGET_INPUT_FIELDS)
+    return hashlib.sha1(values.encode('utf-8')).hexdigest()
+
+# сохранение рассчитанных показателей пользователя (без коммита)
+def store_user_targets(user, targets=None, fingerprint=None):
+    if targets is None:
+        targets = calculate_targets(user)
+    if fingerprint is None:
+        fingerprint = targets_fingerprint(user)
+
+    user_targets = UserTargets.query.get(user.id)
+    if not user_targets:
+        user_targets = UserTargets(user_id=user.id)
+        db.session.add(user_targets)
+
+    user_targets.fingerprint = fingerprint
+    for field, value in targets.items():
+        setattr(user_targets, field, value)
+
+    return user_targets
+
+# получение показателей пользователя: пересчет только при изменении параметров профиля
+def get_user_targets(user):
+    fingerprint = targets_fingerprint(user)
+    user_targets = UserTargets.query.get(user.id)
+
+    if user_targets and user_targets.fingerprint == fingerprint:
+        return user_targets.to_dict()
+
+    logging.debug(f"Пересчет показателей пользователя {user.username}.")
+    user_targets = store_user_targets(user, fingerprint=fingerprint)
+    targets = user_targets.to_dict()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # показатели уже сохранил параллельный запрос
+        db.session.rollback()
+
+    return targets
+
+# показатели пользователя только для чтения: при устаревании считаются без сохранения
+def lookup_user_targets(user):
+    user_targets = UserTargets.query.get(user.id)
+
+    if user_targets and user_targets.fingerprint == targets_fingerprint(user):
+        return user_targets.to_dict()
+
+    return calculate_targets(user)
+
+# сброс сохраненных показателей пользователя (без коммита)
+def invalidate_user_targets(user):
+    UserTargets.query.filter_by(user_id=user.id).delete()
+
+# фильтры рецептов для диеты
+def recipe_filters(diet_preference):
     filters = []
-    
-    if user.diet_preference == "вегетарианский":
+
+    if diet_preference == "вегетарианский":
         filters.append(Recipe.diet == "вегетарианский")
-    elif user.diet_preference == "веганский":
+    elif diet_preference == "веганский":
         filters.append(Recipe.diet == "веганский")
-    elif user.diet_preference == "безглютеновый":
+    elif diet_preference == "безглютеновый":
         filters.append(Recipe.diet == "безглютеновый")
 
-    if filters:
-        return Recipe.query.filter(*filters).all()
+    return filters
+
+# интенсивность упражнений, подходящая для цели
+def workout_intensities(goal):
+    if goal == "похудение":
+        return ('средняя', 'высокая')
+    elif goal == "набор массы":
+        return ('высокая',)
     else:
-        return Recipe.query.all()
+        return ('средняя', 'низкая')
+
+# диапазон калорийности для группировки пользователей по шаблонам
+def calorie_bucket(daily_calories):
+    return int(daily_calories // current_app.config.get('PLAN_TEMPLATE_CALORIE_BUCKET', 200))
+
+# середина диапазона калорийности
+def bucket_calories(bucket):
+    return (bucket + 0.5) * current_app.config.get('PLAN_TEMPLATE_CALORIE_BUCKET', 200)
+
+# рецепты-кандидаты для приема пищи: ближайшие по калорийности к его доле в дневной норме,
+# а для целей с предпочтительным макронутриентом — с наибольшей его долей среди ближайших
+def meal_candidates(recipes, goal, meal_calories):
+    pool_size = current_app.config.get('PLAN_TEMPLATE_CANDIDATES', 5)
+    macro = GOAL_PREFERRED_MACRO.get(goal)
+
+    candidates = sorted(recipes, key=lambda recipe: abs(recipe.calories - meal_calories))
+    if not macro:
+        return candidates[:pool_size]
+
+    candidates = candidates[:pool_size * 2]
+    return sorted(candidates, key=lambda recipe: getattr(recipe, macro) / recipe.calories, reverse=True)[:pool_size]
+
+# шаблон плана питания для диеты, цели и диапазона калорийности:
+# варианты выбора рецептов с плотностью БЖУ на калорию
+def build_meal_plan_template(diet_preference, goal, daily_calories, variants):
+    filters = recipe_filters(diet_preference)
+    recipes = Recipe.query.filter(*filters).all() if filters else Recipe.query.all()
+    if not recipes:
+        return []
+
+    candidates = {
+        meal: meal_candidates(recipes, goal, daily_calories * share)
+        for meal, share in MEAL_CALORIE_SHARES.items()
+    }
+
+    template = []
+    for _ in range(variants):
+        variant = []
+        for meal, share in MEAL_CALORIE_SHARES.items():
+            recipe = random.choice(candidates[meal])
+            variant.append({
+                "meal_type": meal,
+                "share": share,
+                "recipe_id": recipe.id,
+                "recipe": recipe.name,
+                "cooking_instructions": recipe.cooking_instructions,
+                "protein_per_calorie": recipe.protein / recipe.calories,
+                "fats_per_calorie": recipe.fats / recipe.calories,
+                "carbs_per_calorie": recipe.carbs / recipe.calories
+            })
+        template.append(variant)
+
+    return template
+
+# шаблон плана тренировок: варианты пар упражнений
+def build_workout_template(intensities, variants):
+    exercises = Exercise.query.filter(Exercise.intensity.in_(intensities)).all()
+    if not exercises:
+        return []
+
+    template = []
+    for _ in range(variants):
+        variant = []
+        for _ in range(2):
+            exercise = random.choice(exercises)
+            variant.append({
+                "exercise_id": exercise.id,
+                "workout_type": exercise.name,
+                "duration": exercise.duration,
+                "intensity": exercise.intensity,
+                "execution_instructions": exercise.execution_instructions
+            })
+        template.append(variant)
+
+    return template
+
+# выбор варианта шаблона: у разных пользователей и в разные дни варианты чередуются
+def rotate_template(template, user, day):
+    return template[(user.id + day.toordinal()) % len(template)]
 
 # генерация плана питания
-def generate_meal_plan(user):
-    filtered_recipes = filter_recipes(user)
-    if not filtered_recipes:
+def generate_meal_plan(user, targets=None):
+    if targets is None:
+        targets = get_user_targets(user)
+    daily_calories = targets["daily_calories"]
+    bju = targets
+
+    bucket = calorie_bucket(daily_calories)
+    template = plan_templates.get(
+        "meal",
+        (user.diet_preference, user.goal, bucket),
+        lambda variants: build_meal_plan_template(user.diet_preference, user.goal, bucket_calories(bucket), variants)
+    )
+    if not template:
         return {"msg": "Нет доступных рецептов для выбранной диеты. Пожалуйста, добавьте рецепты в базу данных."}
 
-    daily_calories = calculate_calories(user)
-    bju = calculate_bju(user)
-
-    meals = {
-        "завтрак": daily_calories * 0.25,
-        "обед": daily_calories * 0.35,
-        "ужин": daily_calories * 0.25,
-        "перекус": daily_calories * 0.15
-    }
+    today = datetime.utcnow().date()
+    variant = rotate_template(template, user, today)
 
     meal_plan = []
-    for meal, calories in meals.items():
-        selected_recipe = random.choice(filtered_recipes)
+    for item in variant:
+        calories = daily_calories * item["share"]
 
-        protein = (selected_recipe.protein / selected_recipe.calories) * calories
-        fats = (selected_recipe.fats / selected_recipe.calories) * calories
-        carbs = (selected_recipe.carbs / selected_recipe.calories) * calories
+        protein = item["protein_per_calorie"] * calories
+        fats = item["fats_per_calorie"] * calories
+        carbs = item["carbs_per_calorie"] * calories
 
         if user.goal == 'похудение':
             protein = min(protein, bju['protein'])
@@ -95,22 +279,39 @@ def generate_meal_plan(user):
 
         meal_plan_entry = MealPlan(
             user_id=user.id,
-            date=datetime.utcnow().date(),
-            meal_type=meal,
-            recipe_id=selected_recipe.id,
+            date=today,
+            meal_type=item["meal_type"],
+            recipe_id=item["recipe_id"],
             calories=calories,
             protein=round(protein, 0),
             carbs=round(carbs, 0),
-            fats=round(fats, 0)
+            fats=round(fats, 0),
+            eaten=False
         )
 
-        meal_plan_entry.cooking_instructions = selected_recipe.cooking_instructions
+        meal_plan_entry.cooking_instructions = item["cooking_instructions"]
         meal_plan.append(meal_plan_entry)
 
     db.session.add_all(meal_plan)
+    db.session.flush()
+
+    # ответ собирается из шаблона, без повторной загрузки строк и рецептов после коммита
+    meal_plan_response = [
+        {
+            'id': meal.id,
+            'meal_type': meal.meal_type,
+            'recipe': item["recipe"],
+            'calories': meal.calories,
+            'protein': int(meal.protein),
+            'carbs': int(meal.carbs),
+            'fats': int(meal.fats),
+            'eaten': False
+        }
+        for meal, item in zip(meal_plan, variant)
+    ]
     db.session.commit()
 
-    return {"msg": "План питания успешно сгенерирован", "meal_plan": [meal.to_dict() for meal in meal_plan]}
+    return {"msg": "План питания успешно сгенерирован", "meal_plan": meal_plan_response}
 
 # генерация плана тренировок
 def generate_workout_plan(user, target_day):
@@ -124,19 +325,16 @@ def generate_workout_plan(user, target_day):
 
     days_of_week = user.training_days.split(', ')
 
-    exercise_filters = []
-    if user.goal == "похудение":
-        exercise_filters.append(Exercise.intensity.in_(['средняя', 'высокая']))
-    elif user.goal == "набор массы":
-        exercise_filters.append(Exercise.intensity == 'высокая')
-    else:
-        exercise_filters.append(Exercise.intensity.in_(['средняя', 'низкая']))
-
-    exercises = Exercise.query.filter(*exercise_filters).all()
+    intensities = workout_intensities(user.goal)
+    template = plan_templates.get(
+        "workout",
+        intensities,
+        lambda variants: build_workout_template(intensities, variants)
+    )
 
-    logging.debug(f"Найдено {len(exercises)} доступных упражнений для выбранной цели.")
+    logging.debug(f"Найдено {len(template)} вариантов тренировок для выбранной цели.")
 
-    if not exercises:
+    if not template:
         logging.error("Ошибка: Нет доступных упражнений для выбранной цели.")
         return {"msg": "Нет доступных упражнений для выбранной цели."}
 
@@ -166,27 +364,40 @@ def generate_workout_plan(user, target_day):
         logging.debug(f"{target_day}: Сегодня отдыхаем")
         return [{"msg": f"Сегодня {target_day}, день отдыха."}]
 
-    for _ in range(2):
-        selected_exercise = random.choice(exercises)
+    day_num = day_mapping.get(target_day)
+    workout_date = today + timedelta(days=day_num)
+    variant = rotate_template(template, user, workout_date)
 
-        day_num = day_mapping.get(target_day)
+    for item in variant:
         workout_plan_entry = WorkoutPlan(
             user_id=user.id,
-            date=datetime.utcnow().date() + timedelta(days=day_num),
-            exercise_id=selected_exercise.id,
-            duration=selected_exercise.duration,
-            intensity=selected_exercise.intensity,
+            date=workout_date,
+            exercise_id=item["exercise_id"],
+            duration=item["duration"],
+            intensity=item["intensity"],
             completed=False
         )
 
-        workout_plan_entry.execution_instructions = selected_exercise.execution_instructions
+        workout_plan_entry.execution_instructions = item["execution_instructions"]
         workout_plan.append(workout_plan_entry)
 
     logging.debug(f"Добавлено {len(workout_plan)} тренировок для дня {target_day}.")
 
     db.session.add_all(workout_plan)
+    db.session.flush()
+
+    workout_plan_response = [
+        {
+            'id': workout.id,
+            'workout_type': item["workout_type"],
+            'duration': workout.duration,
+            'intensity': workout.intensity,
+            'completed': False
+        }
+        for workout, item in zip(workout_plan, variant)
+    ]
     db.session.commit()
 
     logging.info(f"План тренировок для дня {target_day} успешно сгенерирован и сохранен в базе данных.")
 
-    return [workout.to_dict() for workout in workout_plan]
\ No newline at end of file
+    return workout_plan_response
\ No newline at end of file
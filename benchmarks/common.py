@@ -0,0 +1,100 @@
+import os
+import random
+import tempfile
+from datetime import datetime
+from flask_jwt_extended import create_access_token
+from app import create_app
+from app.models import User, Recipe, Exercise, MealPlan, db
+
+DIETS = ["обычный", "вегетарианский", "веганский", "безглютеновый"]
+GOALS = ["похудение", "набор массы", "поддержание"]
+ACTIVITY_LEVELS = ["низкая", "средняя", "высокая"]
+INTENSITIES = ["низкая", "средняя", "высокая"]
+MEAL_TYPES = ["завтрак", "обед", "ужин", "перекус"]
+
+# приложение на временной базе данных
+def create_benchmark_app(**config_overrides):
+    workdir = tempfile.mkdtemp(prefix='healthmanager-bench-')
+    config = {
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(workdir, 'healthManager.db')}",
+        'PROGRESS_JOURNAL_DIR': os.path.join(workdir, 'progress_journal'),
+        'ARCHIVE_DATABASE_PATH': os.path.join(workdir, 'healthManager_archive.db'),
+        'PROGRESS_EVENTS_DB_PATH': os.path.join(workdir, 'progress_events.db'),
+        'JWT_SECRET_KEY': 'benchmark-secret-key-benchmark-secret-key',
+    }
+    config.update(config_overrides)
+    return create_app(config), workdir
+
+# заполнение каталога рецептов и упражнений
+def seed_catalog(recipes=40, exercises=30):
+    for i in range(recipes):
+        db.session.add(Recipe(
+            name=f"Рецепт {i}",
+            calories=random.randint(200, 800),
+            protein=random.randint(5, 50),
+            carbs=random.randint(10, 100),
+            fats=random.randint(5, 40),
+            diet=DIETS[i % len(DIETS)],
+            cooking_instructions="Смешать и приготовить."
+        ))
+    for i in range(exercises):
+        db.session.add(Exercise(
+            name=f"Упражнение {i}",
+            description="Описание",
+            duration=random.randint(10, 60),
+            intensity=INTENSITIES[i % len(INTENSITIES)],
+            calories_burned_per_minute=random.uniform(3, 12),
+            execution_instructions="Выполнить упражнение."
+        ))
+    db.session.commit()
+
+# создание пользователей со случайными параметрами
+def seed_users(count, password_hash='benchmark'):
+    users = []
+    for i in range(count):
+        users.append(User(
+            username=f"user{i}",
+            password_hash=password_hash,
+            first_name="Иван",
+            last_name="Иванов",
+            age=random.randint(18, 70),
+            weight=random.uniform(50, 120),
+            height=random.uniform(150, 200),
+            gender=random.choice(["male", "female"]),
+            activity_level=random.choice(ACTIVITY_LEVELS),
+            diet_preference=random.choice(DIETS),
+            goal=random.choice(GOALS),
+            training_days="Понедельник, Вторник, Среда, Четверг, Пятница, Суббота, Воскресенье"
+        ))
+    db.session.add_all(users)
+    db.session.commit()
+    return users
+
+# план питания на сегодня для каждого пользователя
+def seed_meal_plans(users):
+    recipes = Recipe.query.all()
+    today = datetime.utcnow().date()
+    for user in users:
+        for meal_type in MEAL_TYPES:
+            recipe = random.choice(recipes)
+            db.session.add(MealPlan(
+                user_id=user.id,
+                date=today,
+                meal_type=meal_type,
+                recipe_id=recipe.id,
+                calories=recipe.calories,
+                protein=recipe.protein,
+                carbs=recipe.carbs,
+                fats=recipe.fats
+            ))
+    db.session.commit()
+
+def auth_header(user_id):
+    return {'Authorization': f"Bearer {create_access_token(identity=str(user_id))}"}
+
+# перцентиль по отсортированному списку
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
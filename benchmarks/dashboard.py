@@ -0,0 +1,155 @@
+# сравнение /dashboard с текущей последовательностью запросов клиента
+#
+# клиент сейчас открывает экран четырьмя запросами: /profile, /meal-plan,
+# /workout-plan и /user-progress. /dashboard возвращает те же данные за неделю
+# одним ответом. скрипт проверяет, что число SQL-запросов /dashboard не зависит
+# от длины периода и числа записей (в том числе для периодов, частично
+# перенесенных в архив), и сравнивает задержку.
+#
+#     python -m benchmarks.dashboard --iterations 200
+import argparse
+import random
+import shutil
+import time
+from datetime import datetime, timedelta
+from flask import has_request_context, request
+from sqlalchemy import event
+import app.archive as archive
+from app.archive import archive_plans
+from app.models import MealPlan, WorkoutPlan, UserProgress, Recipe, Exercise, db
+from benchmarks.common import create_benchmark_app, seed_catalog, seed_users, auth_header, percentile, MEAL_TYPES
+
+# ожидаемое число SQL-запросов /dashboard: пользователь, показатели, питание, тренировки, прогресс
+DASHBOARD_QUERY_COUNT = 5
+# дополнительные запросы, если в архиве есть планы за период: названия рецептов и упражнений
+DASHBOARD_ARCHIVE_NAME_QUERIES = 2
+# запросов к файлу архива
+DASHBOARD_ARCHIVE_QUERIES = 1
+ARCHIVE_HORIZON_DAYS = 30
+LEGACY_SEQUENCE = ('/profile', '/meal-plan', '/workout-plan', '/user-progress')
+
+# планы и прогресс пользователя за период
+def seed_history(user, start, days):
+    recipes = Recipe.query.all()
+    exercises = Exercise.query.all()
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        for meal_type in MEAL_TYPES:
+            recipe = random.choice(recipes)
+            db.session.add(MealPlan(
+                user_id=user.id, date=day, meal_type=meal_type, recipe_id=recipe.id,
+                calories=recipe.calories, protein=recipe.protein, carbs=recipe.carbs, fats=recipe.fats,
+                eaten=random.random() < 0.5
+            ))
+        for _ in range(2):
+            exercise = random.choice(exercises)
+            db.session.add(WorkoutPlan(
+                user_id=user.id, date=day, exercise_id=exercise.id,
+                duration=exercise.duration, intensity=exercise.intensity, completed=False
+            ))
+        db.session.add(UserProgress(
+            user_id=user.id, date=day, total_calories_consumed=0, total_calories_burned=150,
+            workouts_completed=1, total_protein_consumed=0, total_carbs_consumed=0, total_fats_consumed=0
+        ))
+    db.session.commit()
+
+# подключение к архиву с подсчетом запросов SELECT в counter['archive']
+def traced_connect_archive(counter, connect_archive=archive.connect_archive):
+    def count_statement(statement):
+        if statement.lstrip().upper().startswith('SELECT'):
+            counter['archive'] = counter.get('archive', 0) + 1
+
+    def connect():
+        connection = connect_archive()
+        connection.set_trace_callback(count_statement)
+        return connection
+
+    return connect
+
+def timed(client, paths, headers, iterations):
+    durations = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        for path in paths:
+            response = client.get(path, headers=headers)
+            assert response.status_code == 200, (path, response.status_code)
+        durations.append(time.perf_counter() - started)
+    return sorted(durations)
+
+def main():
+    parser = argparse.ArgumentParser(description="Сводка за неделю против последовательности запросов")
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    app, workdir = create_benchmark_app(PROGRESS_WRITE_BEHIND=False)
+    with app.app_context():
+        seed_catalog()
+        user = seed_users(1)[0]
+        today = datetime.utcnow().date()
+        seed_history(user, today - timedelta(days=60), 61)
+        archive_plans(horizon_days=ARCHIVE_HORIZON_DAYS)
+        headers = auth_header(user.id)
+
+        statements = {}
+
+        @event.listens_for(db.engine, 'before_cursor_execute')
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            if has_request_context():
+                key = request.full_path.rstrip('?')
+                statements[key] = statements.get(key, 0) + 1
+
+    client = app.test_client()
+
+    # прогрев: сохранение показателей и генерация плана тренировок на сегодня
+    for path in LEGACY_SEQUENCE:
+        client.get(path, headers=headers)
+
+    archive_statements = {}
+    archive.connect_archive = traced_connect_archive(archive_statements)
+
+    # число запросов не зависит от длины периода; периоды старше горизонта читаются из архива
+    ranges = [
+        (today - timedelta(days=6), today, False),
+        (today - timedelta(days=27), today, False),
+        (today - timedelta(days=50), today - timedelta(days=44), True),
+        (today - timedelta(days=40), today - timedelta(days=10), True),
+    ]
+    for start, end, reaches_archive in ranges:
+        path = f"/dashboard?start={start}&end={end}"
+        statements.clear()
+        archive_statements.clear()
+        response = client.get(path, headers=headers)
+        assert response.status_code == 200, response.get_json()
+        body = response.get_json()
+        days = (end - start).days + 1
+        assert len(body["days"]) == days
+        meals = sum(len(day["meal_plan"]) for day in body["days"])
+        assert meals == days * len(MEAL_TYPES), "в сводке есть дни без планов"
+
+        expected = DASHBOARD_QUERY_COUNT + (DASHBOARD_ARCHIVE_NAME_QUERIES if reaches_archive else 0)
+        print(
+            f"/dashboard за {days} дн.{' (архив)' if reaches_archive else ''}: "
+            f"SQL-запросов {statements[path]}, к архиву {archive_statements.get('archive', 0)}, приемов пищи {meals}"
+        )
+        assert statements[path] == expected, f"ожидалось {expected} запросов"
+        assert archive_statements.get('archive', 0) == DASHBOARD_ARCHIVE_QUERIES
+
+    statements.clear()
+    for path in LEGACY_SEQUENCE:
+        client.get(path, headers=headers)
+    legacy_statements = sum(statements.values())
+    print(f"последовательность {', '.join(LEGACY_SEQUENCE)} (только сегодня): SQL-запросов {legacy_statements}")
+
+    legacy = timed(client, LEGACY_SEQUENCE, headers, args.iterations)
+    dashboard = timed(client, (f"/dashboard?start={today - timedelta(days=6)}&end={today}",), headers, args.iterations)
+
+    for name, durations in (("последовательность", legacy), ("/dashboard (неделя)", dashboard)):
+        print(
+            f"{name:22} p50 {percentile(durations, 0.5) * 1000:.2f} мс, "
+            f"p95 {percentile(durations, 0.95) * 1000:.2f} мс"
+        )
+
+    shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
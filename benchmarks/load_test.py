@@ -0,0 +1,191 @@
+# нагрузочный тест конкурентного доступа к SQLite
+#
+# запускает приложение в нескольких процессах (каждый — многопоточный сервер werkzeug)
+# на общей временной базе и воспроизводит пользовательские сессии
+# (login -> profile -> meal-plan -> mark-eaten -> user-progress) с растущей конкурентностью.
+#
+#     python -m benchmarks.load_test --workers 4 --levels 1,8,32,64 --duration 10
+#
+# отложенная запись прогресса рассчитана на один процесс приложения,
+# поэтому --write-behind запускается с --workers 1
+import argparse
+import json
+import logging
+import multiprocessing
+import random
+import shutil
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+from werkzeug.security import generate_password_hash
+from app.models import db
+from benchmarks.common import create_benchmark_app, seed_catalog, seed_users, percentile
+
+PASSWORD = "benchmark-password"
+# блокировка базы: маршруты с handle_db_commit_error возвращают текст ошибки,
+# остальные — ответ 503 с признаком database_locked
+LOCKED_MESSAGE = "database is locked"
+LOCKED_ERROR = "database_locked"
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+# рабочий процесс: отдельный экземпляр приложения на общей базе
+def _serve(port, config):
+    from werkzeug.serving import run_simple
+    from app import create_app
+
+    app = create_app(config)
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    run_simple('127.0.0.1', port, app, threaded=True)
+
+def _wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Рабочий процесс на порту {port} не запустился")
+
+class LoadStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.errors = 0
+        self.locked = 0
+
+    def add(self, latency, ok, locked):
+        with self.lock:
+            self.latencies.append(latency)
+            if not ok:
+                self.errors += 1
+            if locked:
+                self.locked += 1
+
+def _request(stats, base_url, method, path, payload=None, token=None):
+    data = json.dumps(payload).encode('utf-8') if payload is not None else None
+    request = urllib.request.Request(base_url + path, data=data, method=method)
+    request.add_header('Content-Type', 'application/json')
+    if token:
+        request.add_header('Authorization', f"Bearer {token}")
+
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            body = response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        body = e.read()
+        status = e.code
+    except OSError as e:
+        body = str(e).encode('utf-8')
+        status = 0
+    latency = time.perf_counter() - started
+
+    text = body.decode('utf-8', errors='replace')
+    stats.add(latency, 200 <= status < 300, LOCKED_MESSAGE in text or LOCKED_ERROR in text)
+    try:
+        return status, json.loads(text)
+    except ValueError:
+        return status, None
+
+# одна пользовательская сессия
+def _session(stats, base_url, username):
+    status, body = _request(stats, base_url, 'POST', '/login', {'username': username, 'password': PASSWORD})
+    if status != 200:
+        return
+    token = body['access_token']
+
+    _request(stats, base_url, 'GET', '/profile', token=token)
+
+    status, body = _request(stats, base_url, 'GET', '/meal-plan', token=token)
+    meals = body.get('meal_plan', []) if isinstance(body, dict) else (body or [])
+    if meals:
+        meal = random.choice(meals)
+        _request(stats, base_url, 'POST', '/meal-plan/mark-eaten', {'meal_plan_id': meal['id']}, token=token)
+
+    _request(stats, base_url, 'GET', '/user-progress', token=token)
+
+def run_level(base_urls, usernames, concurrency, duration):
+    stats = LoadStats()
+    deadline = time.monotonic() + duration
+
+    def client(index):
+        base_url = base_urls[index % len(base_urls)]
+        while time.monotonic() < deadline:
+            _session(stats, base_url, random.choice(usernames))
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(stats.latencies)
+    total = len(latencies)
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "throughput": total / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "error_rate": stats.errors / total if total else 0.0,
+        "locked_rate": stats.locked / total if total else 0.0
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест конкурентного доступа к SQLite")
+    parser.add_argument('--workers', type=int, default=4, help='Количество процессов приложения.')
+    parser.add_argument('--levels', default='1,8,32,64', help='Уровни конкурентности через запятую.')
+    parser.add_argument('--duration', type=float, default=10.0, help='Длительность каждого уровня в секундах.')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--write-behind', action='store_true', help='Включить отложенную запись прогресса.')
+    args = parser.parse_args()
+    if args.write_behind and args.workers > 1:
+        parser.error("--write-behind поддерживает только один процесс приложения (--workers 1).")
+
+    app, workdir = create_benchmark_app()
+    with app.app_context():
+        seed_catalog()
+        usernames = [user.username for user in seed_users(args.users, generate_password_hash(PASSWORD, method='pbkdf2:sha256'))]
+        db.engine.dispose()
+
+    config = {key: app.config[key] for key in ('SQLALCHEMY_DATABASE_URI', 'PROGRESS_JOURNAL_DIR', 'JWT_SECRET_KEY')}
+    config['PROGRESS_WRITE_BEHIND'] = args.write_behind
+
+    context = multiprocessing.get_context('spawn')
+    ports = [_free_port() for _ in range(args.workers)]
+    workers = [context.Process(target=_serve, args=(port, config), daemon=True) for port in ports]
+    for worker in workers:
+        worker.start()
+
+    try:
+        for port in ports:
+            _wait_for_port(port)
+        base_urls = [f"http://127.0.0.1:{port}" for port in ports]
+
+        print(f"{'потоков':>8} {'запросов':>9} {'запр/с':>9} {'p50, мс':>9} {'p99, мс':>9} {'ошибки':>8} {'locked':>8}")
+        for concurrency in [int(level) for level in args.levels.split(',')]:
+            result = run_level(base_urls, usernames, concurrency, args.duration)
+            print(
+                f"{result['concurrency']:>8} {result['requests']:>9} {result['throughput']:>9.1f} "
+                f"{result['p50_ms']:>9.1f} {result['p99_ms']:>9.1f} "
+                f"{result['error_rate']:>8.2%} {result['locked_rate']:>8.2%}"
+            )
+    finally:
+        for worker in workers:
+            worker.terminate()
+            worker.join()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
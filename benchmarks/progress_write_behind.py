@@ -0,0 +1,72 @@
+# сравнение пропускной способности отметок "съедено" с синхронной и отложенной записью прогресса
+#
+#     python -m benchmarks.progress_write_behind --threads 16 --requests 200
+import argparse
+import random
+import shutil
+import threading
+import time
+from app.models import User, MealPlan, UserProgress, db
+from app.progress_queue import progress_writer
+from benchmarks.common import create_benchmark_app, seed_catalog, seed_users, seed_meal_plans, auth_header
+
+def run(write_behind, threads, requests_per_thread, users):
+    app, workdir = create_benchmark_app(PROGRESS_WRITE_BEHIND=write_behind)
+    with app.app_context():
+        seed_catalog()
+        seed_meal_plans(seed_users(users))
+        meals = [(meal.id, meal.user_id, meal.calories) for meal in MealPlan.query.all()]
+        headers = {user.id: auth_header(user.id) for user in User.query.all()}
+
+    # все потоки работают с небольшим числом "горячих" пользователей
+    hot_meals = [meal for meal in meals if meal[1] <= max(1, users // 4)]
+    expected = {}
+    errors = []
+    lock = threading.Lock()
+
+    def worker():
+        client = app.test_client()
+        for _ in range(requests_per_thread):
+            meal_id, user_id, calories = random.choice(hot_meals)
+            response = client.post('/meal-plan/mark-eaten', json={'meal_plan_id': meal_id}, headers=headers[user_id])
+            with lock:
+                if response.status_code == 200:
+                    expected[user_id] = expected.get(user_id, 0) + calories
+                else:
+                    errors.append(response.status_code)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    progress_writer.shutdown()
+
+    with app.app_context():
+        stored = dict(
+            db.session.query(UserProgress.user_id, db.func.sum(UserProgress.total_calories_consumed))
+            .group_by(UserProgress.user_id).all()
+        )
+    consistent = all(stored.get(user_id, 0) == total for user_id, total in expected.items())
+
+    shutil.rmtree(workdir, ignore_errors=True)
+    total = threads * requests_per_thread
+    return total / elapsed, len(errors), consistent
+
+def main():
+    parser = argparse.ArgumentParser(description="Пропускная способность записи прогресса")
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--users', type=int, default=40)
+    args = parser.parse_args()
+
+    for write_behind in (False, True):
+        throughput, errors, consistent = run(write_behind, args.threads, args.requests, args.users)
+        mode = "отложенная запись" if write_behind else "синхронная запись"
+        print(f"{mode:>18}: {throughput:8.1f} запросов/с, ошибок: {errors}, итоги совпадают: {consistent}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# пропускная способность записи прогресса в зависимости от количества шардов
+#
+# несколько процессов одновременно записывают приращения прогресса случайным
+# пользователям (каждая запись — отдельная транзакция), как при отметках "съедено".
+#
+#     python -m benchmarks.shard_write_throughput --shards 1,2,4,8 --processes 8
+#
+# шардирование убирает ожидание единственной блокировки записи SQLite, поэтому
+# пропускная способность растет с числом шардов, только если процессы упираются
+# в эту блокировку (время фиксации транзакции, в первую очередь fsync), а у каждого
+# процесса есть свое ядро процессора. если ядер меньше, чем процессов, тест
+# ограничен процессором и число шардов на результат не влияет: на машине с одним
+# ядром и 8 процессами получено 233, 192 и 162 записей/с для 1, 2 и 4 шардов
+# (ошибок блокировки 0 — записи не ждали друг друга).
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import time
+from datetime import datetime
+
+def _writer(config, user_ids, writes, start_event, result_queue):
+    import logging
+    from sqlalchemy.exc import OperationalError
+    from app import create_app
+    from app.models import db
+    from app.progress_queue import progress_writer
+
+    app = create_app(config)
+    logging.getLogger().setLevel(logging.WARNING)
+    today = datetime.utcnow().date()
+
+    start_event.wait()
+    errors = 0
+    with app.app_context():
+        for _ in range(writes):
+            try:
+                progress_writer.record(random.choice(user_ids), today, total_calories_consumed=100)
+            except OperationalError:
+                db.session.rollback()
+                errors += 1
+    result_queue.put(errors)
+
+def run(shard_count, processes, writes, users):
+    from app.models import db
+    from benchmarks.common import create_benchmark_app, seed_users
+
+    app, workdir = create_benchmark_app(SHARD_COUNT=shard_count)
+    with app.app_context():
+        user_ids = [user.id for user in seed_users(users)]
+        db.session.remove()
+        for engine in app.extensions['sharding'].engines.values() if shard_count > 1 else []:
+            engine.dispose()
+        db.engine.dispose()
+
+    config = {key: app.config[key] for key in ('SQLALCHEMY_DATABASE_URI', 'PROGRESS_JOURNAL_DIR', 'JWT_SECRET_KEY', 'SHARD_COUNT')}
+
+    context = multiprocessing.get_context('spawn')
+    start_event = context.Event()
+    result_queue = context.Queue()
+    workers = [
+        context.Process(target=_writer, args=(config, user_ids, writes, start_event, result_queue))
+        for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+
+    # даем процессам инициализироваться, затем стартуем одновременно
+    time.sleep(3)
+    started = time.perf_counter()
+    start_event.set()
+    errors = sum(result_queue.get() for _ in workers)
+    elapsed = time.perf_counter() - started
+    for worker in workers:
+        worker.join()
+
+    shutil.rmtree(workdir, ignore_errors=True)
+    return processes * writes / elapsed, errors
+
+def main():
+    parser = argparse.ArgumentParser(description="Пропускная способность записи при шардировании")
+    parser.add_argument('--shards', default='1,2,4,8', help='Количества шардов через запятую.')
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--writes', type=int, default=300, help='Записей на процесс.')
+    parser.add_argument('--users', type=int, default=256)
+    args = parser.parse_args()
+
+    cpu_count = os.cpu_count() or 1
+    if cpu_count < args.processes:
+        print(
+            f"Внимание: ядер процессора ({cpu_count}) меньше, чем процессов ({args.processes}); "
+            f"тест ограничен процессором, и рост с числом шардов не проявится."
+        )
+
+    print(f"{'шардов':>7} {'записей/с':>10} {'ошибок':>7}")
+    for shard_count in [int(count) for count in args.shards.split(',')]:
+        throughput, errors = run(shard_count, args.processes, args.writes, args.users)
+        print(f"{shard_count:>7} {throughput:>10.1f} {errors:>7}")
+
+if __name__ == '__main__':
+    main()
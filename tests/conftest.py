@@ -0,0 +1,58 @@
+import pytest
+from app import create_app
+from app.events import progress_events
+from app.plan_templates import plan_templates
+from app.progress_queue import progress_writer
+
+PASSWORD = "test-password"
+
+# фабрика приложений на временной базе; общие объекты (очередь прогресса, кеш шаблонов)
+# приводятся в исходное состояние после теста
+@pytest.fixture
+def make_app(tmp_path):
+    def factory(**config_overrides):
+        config = {
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'healthManager.db'}",
+            'PROGRESS_JOURNAL_DIR': str(tmp_path / 'progress_journal'),
+            'PROGRESS_EVENTS_DB_PATH': str(tmp_path / 'progress_events.db'),
+            'ARCHIVE_DATABASE_PATH': str(tmp_path / 'healthManager_archive.db'),
+            'JWT_SECRET_KEY': 'test-secret-key-test-secret-key-test',
+        }
+        config.update(config_overrides)
+        return create_app(config)
+
+    yield factory
+
+    progress_writer.shutdown()
+    progress_writer.enabled = False
+    progress_events.backend = 'memory'
+    plan_templates.clear()
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+# регистрация пользователя через API
+def register(client, username, **fields):
+    data = {
+        'username': username,
+        'password': PASSWORD,
+        'confirm_password': PASSWORD,
+        'age': 30,
+        'weight': 70,
+        'height': 175,
+        'activity_level': 'средняя',
+        'goal': 'похудение',
+        'first_name': 'Иван',
+        'last_name': 'Иванов',
+        'gender': 'male',
+    }
+    data.update(fields)
+    return client.post('/register', json=data)
+
+def login(client, username):
+    response = client.post('/login', json={'username': username, 'password': PASSWORD})
+    if response.status_code != 200:
+        return None
+    return {'Authorization': f"Bearer {response.get_json()['access_token']}"}
@@ -0,0 +1,65 @@
+import random
+from types import SimpleNamespace
+import pytest
+from app.cohort import calculate_targets_batch, TARGET_FIELDS
+from app.utils import calculate_bmr, calculate_tdee, calculate_calories, calculate_bju
+
+GENDERS = ['male', 'female', 'другой', None]
+ACTIVITY_LEVELS = ['низкая', 'средняя', 'высокая', 'неизвестная', None]
+GOALS = ['похудение', 'набор массы', 'поддержание', 'неизвестная', None]
+
+def random_users(count, seed=0):
+    rng = random.Random(seed)
+    return [
+        SimpleNamespace(
+            weight=rng.uniform(40, 150),
+            height=rng.uniform(140, 210),
+            age=rng.randint(14, 90),
+            gender=rng.choice(GENDERS),
+            activity_level=rng.choice(ACTIVITY_LEVELS),
+            goal=rng.choice(GOALS)
+        )
+        for _ in range(count)
+    ]
+
+# показатели одного пользователя, рассчитанные скалярными функциями
+def scalar_targets(user):
+    return {
+        "bmr": calculate_bmr(user),
+        "tdee": calculate_tdee(user),
+        "daily_calories": calculate_calories(user),
+        **calculate_bju(user)
+    }
+
+def batch_targets(users):
+    return calculate_targets_batch(
+        [user.weight for user in users], [user.height for user in users], [user.age for user in users],
+        [user.gender for user in users], [user.activity_level for user in users], [user.goal for user in users]
+    )
+
+# векторизованный расчет совпадает со скалярным, в том числе для неизвестных значений
+def test_batch_matches_scalar_functions():
+    users = random_users(2000)
+    targets = batch_targets(users)
+
+    for i, user in enumerate(users):
+        expected = scalar_targets(user)
+        for field in TARGET_FIELDS:
+            assert targets[field][i] == pytest.approx(expected[field], abs=1e-9), (field, user)
+
+# значения, для которых округление БЖУ приходится ровно на половину
+def test_batch_rounding_matches_scalar_functions():
+    users = [
+        SimpleNamespace(weight=weight, height=height, age=age, gender='female', activity_level='низкая', goal='похудение')
+        for weight in range(40, 60) for height in (150, 160.5) for age in (20, 33)
+    ]
+    targets = batch_targets(users)
+
+    for i, user in enumerate(users):
+        expected = calculate_bju(user)
+        for field in ("protein", "fats", "carbs"):
+            assert targets[field][i] == expected[field]
+
+def test_empty_cohort():
+    targets = batch_targets([])
+    assert all(targets[field].size == 0 for field in TARGET_FIELDS)
@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+import pytest
+from flask import has_request_context, request
+from sqlalchemy import event
+import app.archive as archive
+from app.archive import archive_plans
+from app.models import User, db
+from benchmarks.common import seed_catalog
+from benchmarks.dashboard import (
+    seed_history, traced_connect_archive, DASHBOARD_QUERY_COUNT,
+    DASHBOARD_ARCHIVE_NAME_QUERIES, DASHBOARD_ARCHIVE_QUERIES
+)
+from tests.conftest import register, login
+
+# пользователь с планами и прогрессом за 61 день; планы старше 30 дней перенесены в архив
+@pytest.fixture
+def dashboard_app(make_app):
+    app = make_app()
+    client = app.test_client()
+    register(client, 'alice')
+    headers = login(client, 'alice')
+    today = datetime.utcnow().date()
+
+    with app.app_context():
+        seed_catalog(recipes=12, exercises=6)
+        seed_history(User.query.filter_by(username='alice').one(), today - timedelta(days=60), 61)
+        archive_plans(horizon_days=30)
+
+    statements = {}
+    with app.app_context():
+        @event.listens_for(db.engine, 'before_cursor_execute')
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            if has_request_context() and request.path == '/dashboard':
+                statements['dashboard'] = statements.get('dashboard', 0) + 1
+
+    return client, headers, today, statements
+
+# число запросов не зависит от длины периода и числа записей
+@pytest.mark.parametrize('start_offset, end_offset, reaches_archive', [
+    (6, 0, False),
+    (27, 0, False),
+    (50, 44, True),
+    (40, 10, True),
+])
+def test_dashboard_query_count_is_fixed(dashboard_app, monkeypatch, start_offset, end_offset, reaches_archive):
+    client, headers, today, statements = dashboard_app
+    archive_statements = {}
+    monkeypatch.setattr(archive, 'connect_archive', traced_connect_archive(archive_statements))
+    start, end = today - timedelta(days=start_offset), today - timedelta(days=end_offset)
+    response = client.get(f"/dashboard?start={start}&end={end}", headers=headers)
+
+    assert response.status_code == 200
+    assert len(response.get_json()["days"]) == start_offset - end_offset + 1
+    expected = DASHBOARD_QUERY_COUNT + (DASHBOARD_ARCHIVE_NAME_QUERIES if reaches_archive else 0)
+    assert statements['dashboard'] == expected
+    assert archive_statements['archive'] == DASHBOARD_ARCHIVE_QUERIES
+
+# сводка и история планов возвращают одни и те же планы, в том числе из архива
+def test_dashboard_matches_history_endpoints(dashboard_app):
+    client, headers, today, _ = dashboard_app
+    start, end = today - timedelta(days=35), today - timedelta(days=25)
+    query = f"start={start}&end={end}"
+
+    days = client.get(f"/dashboard?{query}", headers=headers).get_json()["days"]
+    meal_history = client.get(f"/meal-plan/history?{query}", headers=headers).get_json()
+    workout_history = client.get(f"/workout-plan/history?{query}", headers=headers).get_json()
+
+    for day in days:
+        assert day["meal_plan"], day["date"]
+        assert sorted(meal["id"] for meal in day["meal_plan"]) == sorted(meal["id"] for meal in meal_history[day["date"]])
+        assert sorted(workout["id"] for workout in day["workout_plan"]) == sorted(workout["id"] for workout in workout_history[day["date"]])
+        eaten = [meal for meal in day["meal_plan"] if meal["eaten"]]
+        assert day["progress"]["total_calories_consumed"] == sum(meal["calories"] for meal in eaten)
@@ -0,0 +1,46 @@
+import pytest
+from app.diagnostics import slow_query_logger, read_slow_query_log, REDACTED
+from tests.conftest import register, login, PASSWORD
+
+@pytest.fixture
+def slow_query_app(make_app, tmp_path):
+    def factory(**config_overrides):
+        return make_app(
+            SLOW_QUERY_LOG_ENABLED=True,
+            SLOW_QUERY_THRESHOLD_MS=0,
+            SLOW_QUERY_LOG_PATH=str(tmp_path / 'slow_queries.log'),
+            **config_overrides
+        )
+    yield factory
+
+    for handler in list(slow_query_logger.handlers):
+        slow_query_logger.removeHandler(handler)
+        handler.close()
+
+# хеши паролей не попадают в журнал ни при регистрации, ни при смене пароля
+@pytest.mark.parametrize('shard_count', [1, 2])
+def test_password_hash_is_redacted(slow_query_app, tmp_path, shard_count):
+    client = slow_query_app(SHARD_COUNT=shard_count).test_client()
+    register(client, 'alice')
+    headers = login(client, 'alice')
+    response = client.put('/change-password', json={
+        'current_password': PASSWORD,
+        'new_password': 'new-password',
+        'confirm_new_password': 'new-password'
+    }, headers=headers)
+    assert response.status_code == 200
+
+    log_text = (tmp_path / 'slow_queries.log').read_text(encoding='utf-8')
+    assert 'pbkdf2:sha256' not in log_text
+
+    entries = list(read_slow_query_log(str(tmp_path / 'slow_queries.log')))
+    written = [
+        entry for entry in entries
+        if entry['statement'].lstrip().upper().startswith(('INSERT INTO USER', 'UPDATE USER'))
+        and 'password_hash' in entry['statement']
+    ]
+    assert len(written) == 2
+    for entry in written:
+        assert REDACTED in entry['parameters']
+        # остальные параметры записываются как есть
+        assert any(value not in (REDACTED, None) for value in entry['parameters'])
@@ -0,0 +1,70 @@
+from datetime import date, timedelta
+from types import SimpleNamespace
+from app.utils import meal_candidates, rotate_template
+from benchmarks.common import seed_catalog
+from tests.conftest import register, login
+
+def plan_template_app(make_app):
+    app = make_app(ADMIN_USERNAMES=['admin'], PLAN_TEMPLATE_VARIANTS=7)
+    client = app.test_client()
+    register(client, 'admin')
+    with app.app_context():
+        seed_catalog(recipes=40, exercises=12)
+    return app, client, login(client, 'admin')
+
+def meal_plan_for(client, username, **fields):
+    register(client, username, **fields)
+    response = client.get('/meal-plan', headers=login(client, username))
+    assert response.status_code == 200
+    return response.get_json()
+
+# пользователи с одинаковыми диетой, целью и диапазоном калорийности получают один шаблон,
+# другая цель или другой диапазон — отдельный шаблон
+def test_meal_templates_are_keyed_by_diet_goal_and_bucket(make_app):
+    app, client, admin_headers = plan_template_app(make_app)
+
+    for index in range(4):
+        meal_plan_for(client, f"same{index}")
+    stats = client.get('/admin/plan-templates/stats', headers=admin_headers).get_json()
+    assert stats["meal"] == {"hits": 3, "misses": 1, "hit_rate": 0.75, "templates": 1}
+
+    meal_plan_for(client, 'gainer', goal='набор массы')
+    meal_plan_for(client, 'heavy', weight=110)
+    meal_plan_for(client, 'vegan', diet_preference='веганский')
+    stats = client.get('/admin/plan-templates/stats', headers=admin_headers).get_json()
+    assert stats["meal"]["misses"] == 4
+    assert stats["meal"]["hits"] == 3
+    assert stats["meal"]["templates"] == 4
+
+def test_plan_template_stats_require_admin(make_app):
+    app, client, _ = plan_template_app(make_app)
+    register(client, 'alice')
+    assert client.get('/admin/plan-templates/stats', headers=login(client, 'alice')).status_code == 403
+
+# варианты шаблона чередуются между пользователями и по дням
+def test_rotation_spreads_variants():
+    template = [[index] for index in range(7)]
+    day = date(2026, 10, 19)
+
+    users = [SimpleNamespace(id=user_id) for user_id in range(1, 8)]
+    assert sorted(rotate_template(template, user, day)[0] for user in users) == list(range(7))
+
+    week = [rotate_template(template, users[0], day + timedelta(days=offset))[0] for offset in range(7)]
+    assert sorted(week) == list(range(7))
+
+# для похудения среди ближайших по калорийности рецептов выбираются самые белковые,
+# для набора массы — с наибольшей долей углеводов
+def test_goal_shapes_meal_candidates(make_app):
+    app = make_app(PLAN_TEMPLATE_CANDIDATES=2)
+    recipes = [
+        SimpleNamespace(name='близкий', calories=500, protein=10, carbs=80),
+        SimpleNamespace(name='белковый', calories=520, protein=50, carbs=20),
+        SimpleNamespace(name='углеводный', calories=480, protein=5, carbs=100),
+        SimpleNamespace(name='средний', calories=510, protein=30, carbs=40),
+        SimpleNamespace(name='далекий', calories=900, protein=90, carbs=150),
+    ]
+
+    with app.app_context():
+        assert [recipe.name for recipe in meal_candidates(recipes, None, 500)] == ['близкий', 'средний']
+        assert [recipe.name for recipe in meal_candidates(recipes, 'похудение', 500)] == ['белковый', 'средний']
+        assert [recipe.name for recipe in meal_candidates(recipes, 'набор массы', 500)] == ['углеводный', 'близкий']
@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+import pytest
+from datetime import datetime
+from app.models import User, UserProgress
+from app.progress_queue import progress_writer
+from tests.conftest import register
+
+def create_users(app, *usernames):
+    client = app.test_client()
+    for username in usernames:
+        register(client, username)
+    with app.app_context():
+        return [User.query.filter_by(username=username).one().id for username in usernames]
+
+def consumed(app, user_id, day):
+    with app.app_context():
+        return sum(progress.total_calories_consumed for progress in UserProgress.query.filter_by(user_id=user_id, date=day))
+
+# падение процесса: фоновый поток остановлен, блокировка журнала снята, приращения не записаны
+def crash(writer):
+    writer.flush = lambda: 0
+    writer._stopped.set()
+    writer._wakeup.set()
+    writer._thread.join()
+    del writer.flush
+    writer._journal.close()
+    writer._lock_file.close()
+
+def test_flush_coalesces_increments(make_app):
+    app = make_app(PROGRESS_WRITE_BEHIND=True, PROGRESS_FLUSH_INTERVAL=60)
+    user_id, = create_users(app, 'alice')
+    today = datetime.utcnow().date()
+
+    with app.app_context():
+        for _ in range(5):
+            progress_writer.record(user_id, today, total_calories_consumed=100)
+
+    assert progress_writer.flush() == 1
+    assert consumed(app, user_id, today) == 500
+
+# после падения незаписанные приращения восстанавливаются из журнала при следующем запуске
+def test_recover_replays_journal_after_crash(make_app):
+    app = make_app(PROGRESS_WRITE_BEHIND=True, PROGRESS_FLUSH_INTERVAL=60)
+    user_id, = create_users(app, 'alice')
+    today = datetime.utcnow().date()
+
+    with app.app_context():
+        progress_writer.record(user_id, today, total_calories_consumed=300)
+        progress_writer.record(user_id, today, total_calories_consumed=200)
+    crashed_token = progress_writer._token
+    crash(progress_writer)
+    assert consumed(app, user_id, today) == 0
+
+    app = make_app(PROGRESS_WRITE_BEHIND=True, PROGRESS_FLUSH_INTERVAL=60)
+    assert consumed(app, user_id, today) == 500
+    assert not [name for name in os.listdir(app.config['PROGRESS_JOURNAL_DIR']) if name.startswith(crashed_token)]
+
+# пакет, записанный до падения (но не удаленный из журнала), при повторе пропускается
+def test_replayed_batch_is_applied_once(make_app):
+    app = make_app(PROGRESS_WRITE_BEHIND=True, PROGRESS_FLUSH_INTERVAL=60)
+    user_id, = create_users(app, 'alice')
+    today = datetime.utcnow().date()
+
+    pending = {(user_id, today): {"total_calories_consumed": 250}}
+    progress_writer._commit_batch("crashed.00000001.log", dict(pending))
+    progress_writer._commit_batch("crashed.00000001.log", dict(pending))
+
+    assert consumed(app, user_id, today) == 250
+
+# чтение своих записей во время записи пакета другим потоком
+def test_flush_user_waits_for_in_flight_flush(make_app):
+    app = make_app(PROGRESS_WRITE_BEHIND=True, PROGRESS_FLUSH_INTERVAL=60)
+    user_id, = create_users(app, 'alice')
+    today = datetime.utcnow().date()
+
+    commit_batch = progress_writer._commit_batch
+    committing = threading.Event()
+    def slow_commit_batch(batch_id, pending):
+        committing.set()
+        time.sleep(0.3)
+        commit_batch(batch_id, pending)
+    progress_writer._commit_batch = slow_commit_batch
+
+    try:
+        with app.app_context():
+            progress_writer.record(user_id, today, total_calories_consumed=100)
+        flusher = threading.Thread(target=progress_writer.flush)
+        flusher.start()
+        committing.wait(5)
+
+        progress_writer.flush_user(user_id, today)
+        assert consumed(app, user_id, today) == 100
+        flusher.join()
+    finally:
+        del progress_writer._commit_batch
+
+# приращения в памяти видны только своему процессу, поэтому второй процесс с тем же журналом не запускается
+def test_second_writer_on_same_journal_is_refused(make_app):
+    app = make_app(PROGRESS_WRITE_BEHIND=True, PROGRESS_FLUSH_INTERVAL=60)
+    user_id, = create_users(app, 'alice')
+    today = datetime.utcnow().date()
+
+    with pytest.raises(RuntimeError):
+        make_app(PROGRESS_WRITE_BEHIND=True, PROGRESS_FLUSH_INTERVAL=60)
+
+    # работающая очередь не затронута отклоненным запуском
+    with app.app_context():
+        progress_writer.record(user_id, today, total_calories_consumed=100)
+    assert progress_writer.flush() == 1
+    assert consumed(app, user_id, today) == 100
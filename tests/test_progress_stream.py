@@ -0,0 +1,173 @@
+import json
+import pytest
+from flask import has_request_context, request
+from sqlalchemy import event
+import app.routes as routes
+from app.models import User, MealPlan, WorkoutPlan, Exercise, UserProgress, db
+from datetime import datetime
+from benchmarks.common import seed_catalog, seed_meal_plans
+from tests.conftest import register, login
+
+# сообщения SSE из потокового ответа тестового клиента: (event, id, data)
+def read_messages(response):
+    buffer = ""
+    for chunk in response.response:
+        buffer += chunk.decode('utf-8') if isinstance(chunk, bytes) else chunk
+        while "\n\n" in buffer:
+            message, buffer = buffer.split("\n\n", 1)
+            fields = dict(line.split(": ", 1) for line in message.splitlines() if not line.startswith(":"))
+            if "data" in fields:
+                yield fields["event"], int(fields["id"]) if "id" in fields else None, json.loads(fields["data"])
+
+def next_message(messages, event_type):
+    for message in messages:
+        if message[0] == event_type:
+            return message
+    raise AssertionError(f"поток закончился без события {event_type}")
+
+# приложение с пользователем и его планом питания на сегодня
+@pytest.fixture
+def stream_app(make_app):
+    def factory(**config_overrides):
+        app = make_app(PROGRESS_STREAM_HEARTBEAT=0.2, PROGRESS_EVENTS_POLL_INTERVAL=0.05, **config_overrides)
+        client = app.test_client()
+        register(client, 'alice')
+        headers = login(client, 'alice')
+        with app.app_context():
+            seed_catalog(recipes=8, exercises=4)
+            user = User.query.filter_by(username='alice').one()
+            seed_meal_plans([user])
+            meal_ids = [meal.id for meal in MealPlan.query.filter_by(user_id=user.id).order_by(MealPlan.id)]
+        return app, client, headers, meal_ids
+    return factory
+
+# итоговый прогресс по снимку и событиям потока
+def apply_events(progress, events):
+    for event_data in events:
+        for field, value in event_data["delta"].items():
+            progress[field] += value
+    return progress
+
+# одно соединение /user-progress/stream отражает все отметки, которые клиент
+# иначе получал бы опросом /user-progress после каждой из них
+def test_stream_replaces_polling(stream_app):
+    app, client, headers, meal_ids = stream_app()
+
+    statements = {}
+    with app.app_context():
+        @event.listens_for(db.engine, 'before_cursor_execute')
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            path = request.path if has_request_context() else None
+            statements[path] = statements.get(path, 0) + 1
+
+    response = client.get('/user-progress/stream', headers=headers, buffered=False)
+    messages = read_messages(response)
+    _, _, progress = next_message(messages, 'snapshot')
+    snapshot_statements = statements.get('/user-progress/stream', 0)
+
+    for meal_id in meal_ids:
+        assert client.post('/meal-plan/mark-eaten', json={'meal_plan_id': meal_id}, headers=headers).status_code == 200
+
+        _, _, event_data = next_message(messages, 'progress')
+        assert event_data["meal_plan_id"] == meal_id
+        for field, value in event_data["delta"].items():
+            progress[field] += value
+
+        polled = client.get('/user-progress', headers=headers).get_json()
+        for field in ("total_calories_consumed", "total_protein_consumed", "total_carbs_consumed", "total_fats_consumed"):
+            assert progress[field] == polled[field]
+
+    response.close()
+
+    # после снимка поток не обращается к базе данных
+    assert statements.get('/user-progress/stream', 0) == snapshot_statements
+
+# события, уже учтенные в снимке, не передаются новому подписчику повторно
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_snapshot_is_not_followed_by_counted_events(stream_app, backend):
+    app, client, headers, meal_ids = stream_app(PROGRESS_EVENTS_BACKEND=backend)
+
+    # подписчик, который отключается до следующих изменений
+    response = client.get('/user-progress/stream', headers=headers, buffered=False)
+    next_message(read_messages(response), 'snapshot')
+    response.close()
+
+    client.post('/meal-plan/mark-eaten', json={'meal_plan_id': meal_ids[0]}, headers=headers)
+
+    response = client.get('/user-progress/stream', headers=headers, buffered=False)
+    messages = read_messages(response)
+    _, snapshot_id, snapshot = next_message(messages, 'snapshot')
+    assert snapshot["last_event_id"] == snapshot_id
+    assert snapshot["total_calories_consumed"] > 0
+
+    client.post('/meal-plan/mark-eaten', json={'meal_plan_id': meal_ids[1]}, headers=headers)
+
+    _, event_id, event_data = next_message(messages, 'progress')
+    response.close()
+    assert event_id > snapshot_id
+    assert event_data["meal_plan_id"] == meal_ids[1]
+
+# повторная отметка съеденного приема пищи не меняет прогресс и не публикует событие
+def test_meal_marked_twice_is_counted_once(stream_app):
+    app, client, headers, meal_ids = stream_app()
+
+    response = client.get('/user-progress/stream', headers=headers, buffered=False)
+    messages = read_messages(response)
+    _, _, progress = next_message(messages, 'snapshot')
+
+    assert client.post('/meal-plan/mark-eaten', json={'meal_plan_id': meal_ids[0]}, headers=headers).status_code == 200
+    assert client.post('/meal-plan/mark-eaten', json={'meal_plan_id': meal_ids[0]}, headers=headers).status_code == 400
+    assert client.post('/meal-plan/mark-eaten', json={'meal_plan_id': meal_ids[1]}, headers=headers).status_code == 200
+
+    events = [next_message(messages, 'progress')[2] for _ in range(2)]
+    response.close()
+    assert [event["meal_plan_id"] for event in events] == [meal_ids[0], meal_ids[1]]
+
+    apply_events(progress, events)
+    # приращение записано один раз (до того, как /user-progress пересчитает сумму)
+    with app.app_context():
+        user_id = User.query.filter_by(username='alice').one().id
+        stored = sum(row.total_calories_consumed for row in UserProgress.query.filter_by(user_id=user_id))
+    polled = client.get('/user-progress', headers=headers).get_json()
+    assert progress["total_calories_consumed"] == stored == polled["total_calories_consumed"]
+
+# отметки, сделанные между подпиской и чтением снимка, учитываются ровно один раз:
+# они видны в снимке, и их события отсеиваются по id планов
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+@pytest.mark.parametrize('write_behind', [False, True])
+def test_change_between_subscribe_and_snapshot_is_counted_once(stream_app, monkeypatch, backend, write_behind):
+    app, client, headers, meal_ids = stream_app(
+        PROGRESS_EVENTS_BACKEND=backend, PROGRESS_WRITE_BEHIND=write_behind, PROGRESS_FLUSH_INTERVAL=60
+    )
+    with app.app_context():
+        user = User.query.filter_by(username='alice').one()
+        exercise = Exercise.query.first()
+        workout = WorkoutPlan(user_id=user.id, date=datetime.utcnow().date(), exercise_id=exercise.id, duration=30, intensity=exercise.intensity)
+        db.session.add(workout)
+        db.session.commit()
+        workout_id = workout.id
+
+    get_progress_snapshot = routes.get_progress_snapshot
+    def snapshot_after_changes(user_id, day):
+        assert client.post('/meal-plan/mark-eaten', json={'meal_plan_id': meal_ids[0]}, headers=headers).status_code == 200
+        assert client.post('/workout-plan/mark-completed', json={'workout_plan_id': workout_id}, headers=headers).status_code == 200
+        return get_progress_snapshot(user_id, day)
+    monkeypatch.setattr(routes, 'get_progress_snapshot', snapshot_after_changes)
+
+    response = client.get('/user-progress/stream', headers=headers, buffered=False)
+    messages = read_messages(response)
+    _, _, progress = next_message(messages, 'snapshot')
+    assert progress["eaten_meal_ids"] == [meal_ids[0]]
+    assert progress["completed_workout_ids"] == [workout_id]
+    monkeypatch.setattr(routes, 'get_progress_snapshot', get_progress_snapshot)
+
+    client.post('/meal-plan/mark-eaten', json={'meal_plan_id': meal_ids[1]}, headers=headers)
+    _, _, event_data = next_message(messages, 'progress')
+    response.close()
+    # первым передается событие, которого нет в снимке
+    assert event_data["meal_plan_id"] == meal_ids[1]
+
+    apply_events(progress, [event_data])
+    polled = client.get('/user-progress', headers=headers).get_json()
+    for field in ("total_calories_consumed", "total_calories_burned", "workouts_completed", "total_protein_consumed"):
+        assert progress[field] == polled[field], field
@@ -0,0 +1,139 @@
+import sqlite3
+import threading
+import pytest
+from datetime import datetime, timedelta
+from app.models import User
+from app.progress_queue import progress_writer
+from app.sharding import rebalance_shards
+from tests.conftest import register, login
+
+def shard_users(tmp_path, index):
+    with sqlite3.connect(tmp_path / f"healthManager_shard{index}.db") as connection:
+        return connection.execute("SELECT id, username FROM user ORDER BY id").fetchall()
+
+# включение шардирования на установке без него: пользователи переносятся в шарды с прежними id
+def test_existing_users_migrate_into_shards(make_app, tmp_path):
+    client = make_app().test_client()
+    for username in ('alice', 'bob', 'carol'):
+        assert register(client, username).status_code == 201
+
+    client = make_app(SHARD_COUNT=2).test_client()
+    for username in ('alice', 'bob', 'carol'):
+        assert login(client, username) is not None
+
+    assert register(client, 'dave').status_code == 201
+    with sqlite3.connect(tmp_path / 'healthManager.db') as connection:
+        assert connection.execute("SELECT COUNT(*) FROM user").fetchone()[0] == 0
+
+    users = sorted(shard_users(tmp_path, 0) + shard_users(tmp_path, 1))
+    assert users == [(1, 'alice'), (2, 'bob'), (3, 'carol'), (4, 'dave')]
+
+# поиск строки по id, который не является целым числом, дает 404, как без шардирования
+@pytest.mark.parametrize('shard_count', [1, 2])
+@pytest.mark.parametrize('path, payload', [
+    ('/meal-plan/mark-eaten', {}),
+    ('/meal-plan/mark-eaten', {'meal_plan_id': None}),
+    ('/meal-plan/mark-eaten', {'meal_plan_id': 'abc'}),
+    ('/meal-plan/mark-eaten', {'meal_plan_id': 10 ** 15}),
+    ('/workout-plan/mark-completed', {}),
+    ('/workout-plan/mark-completed', {'workout_plan_id': 'abc'}),
+])
+def test_lookup_by_invalid_row_id_returns_404(make_app, shard_count, path, payload):
+    client = make_app(SHARD_COUNT=shard_count).test_client()
+    register(client, 'alice')
+    assert client.post(path, json=payload, headers=login(client, 'alice')).status_code == 404
+
+def test_rebalance_keeps_users_reachable(make_app):
+    client = make_app(SHARD_COUNT=2).test_client()
+    for username in ('alice', 'bob', 'carol', 'dave'):
+        register(client, username)
+
+    app = make_app(SHARD_COUNT=3)
+    rebalance_shards(app.extensions['sharding'], previous_count=2)
+
+    client = app.test_client()
+    for username in ('alice', 'bob', 'carol', 'dave'):
+        headers = login(client, username)
+        assert client.get('/profile', headers=headers).get_json()['username'] == username
+
+# логин уникален во всех шардах, в том числе при параллельной регистрации
+def test_concurrent_registrations_create_one_user(make_app):
+    app = make_app(SHARD_COUNT=4)
+    statuses = []
+
+    def register_eve():
+        statuses.append(register(app.test_client(), 'eve').status_code)
+
+    threads = [threading.Thread(target=register_eve) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(statuses) == [201] + [400] * 7
+    with app.app_context():
+        assert len(User.query.filter_by(username='eve').all()) == 1
+
+def test_rename_reserves_new_username_and_releases_old(make_app):
+    client = make_app(SHARD_COUNT=2).test_client()
+    register(client, 'alice')
+    register(client, 'bob')
+    headers = login(client, 'bob')
+
+    assert client.put('/profile', json={'username': 'alice'}, headers=headers).status_code == 400
+    assert client.put('/profile', json={'username': 'robert'}, headers=headers).status_code == 200
+    assert register(client, 'bob').status_code == 201
+    assert register(client, 'robert').status_code == 400
+
+# резерв логина, после которого процесс упал до записи пользователя в шард, снимается при запуске
+def test_orphaned_username_reservations_are_released_at_startup(make_app, tmp_path):
+    client = make_app(SHARD_COUNT=2).test_client()
+    register(client, 'alice')
+
+    now = datetime.utcnow()
+    with sqlite3.connect(tmp_path / 'healthManager.db') as connection:
+        connection.executemany(
+            "INSERT INTO username_registry (username, user_id, reserved_at) VALUES (?, ?, ?)",
+            [('ghost', 900, str(now - timedelta(hours=1))), ('pending', 901, str(now))]
+        )
+
+    client = make_app(SHARD_COUNT=2).test_client()
+    with sqlite3.connect(tmp_path / 'healthManager.db') as connection:
+        registered = sorted(row[0] for row in connection.execute("SELECT username FROM username_registry"))
+    # недавний резерв может принадлежать регистрации, которая еще выполняется
+    assert registered == ['alice', 'pending']
+
+    assert register(client, 'ghost').status_code == 201
+    assert register(client, 'alice').status_code == 400
+
+# отметка о пакете прогресса записывается в каждый шард вместе с его приращениями
+def test_progress_batch_marker_is_written_per_shard(make_app, tmp_path):
+    app = make_app(SHARD_COUNT=2, PROGRESS_WRITE_BEHIND=True, PROGRESS_FLUSH_INTERVAL=60)
+    client = app.test_client()
+    usernames = [f"user{index}" for index in range(6)]
+    for username in usernames:
+        register(client, username)
+    with app.app_context():
+        user_ids = [User.query.filter_by(username=username).one().id for username in usernames]
+    today = datetime.utcnow().date()
+
+    with app.app_context():
+        for user_id in user_ids:
+            progress_writer.record(user_id, today, total_calories_consumed=100)
+    progress_writer.flush()
+
+    for index in range(2):
+        with sqlite3.connect(tmp_path / f"healthManager_shard{index}.db") as connection:
+            assert connection.execute("SELECT COUNT(*) FROM progress_flush_batch").fetchone()[0] == 1
+            consumed = connection.execute("SELECT SUM(total_calories_consumed) FROM user_progress").fetchone()[0]
+        assert consumed == 100 * len(shard_users(tmp_path, index))
+
+    # повтор пакета (например, из журнала после падения) пропускается в каждом шарде
+    with sqlite3.connect(tmp_path / "healthManager_shard0.db") as connection:
+        batch_id = connection.execute("SELECT id FROM progress_flush_batch").fetchone()[0]
+    progress_writer._commit_batch(batch_id, {(user_id, today): {"total_calories_consumed": 100} for user_id in user_ids})
+
+    for index in range(2):
+        with sqlite3.connect(tmp_path / f"healthManager_shard{index}.db") as connection:
+            consumed = connection.execute("SELECT SUM(total_calories_consumed) FROM user_progress").fetchone()[0]
+        assert consumed == 100 * len(shard_users(tmp_path, index))